@@ -0,0 +1,186 @@
+"""
+End-to-end scaling benchmark for main.py.
+
+Generates synthetic posts.csv / comments.csv at increasing sizes, runs each mode of the pipeline
+in an isolated data directory (offline: hashing stand-in encoder, no downloads) and records
+per-stage wall time and memory from the run report. Fails when a stored baseline is exceeded.
+A stage's memory is its own: the RSS change over the stage and, when main.py runs with --profile, its
+tracemalloc peak. Only the 'total' entry has the peak RSS of the whole process.
+
+    python benchmarks/e2e_benchmark.py --sizes 1000,5000,20000
+    python benchmarks/e2e_benchmark.py --update-baseline
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from src.config import Config
+from src.distortion_detector import DistortionDetector
+
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'e2e_baseline.json')
+METRICS = ['wall_s', 'rss_delta_mb', 'traced_peak_mb', 'peak_rss_mb']
+MEMORY_METRICS = ['rss_delta_mb', 'traced_peak_mb', 'peak_rss_mb']
+
+FILLER = ("the a my our it this that today work school friends family sleep therapy weekend "
+          "job money time people life feel think said went tried again really just still").split()
+
+def generate_corpus(n_posts, out_dir, seed=0):
+    """
+    Writes posts.csv (n_posts rows) and comments.csv (2 x n_posts rows) with dates spread over
+    2018-2023, a pool of authors and sentences that mix filler words with lexicon phrases.
+    """
+    rng = np.random.default_rng(seed)
+    phrases = [p for ngrams in DistortionDetector().distortion_dictionaries.values() for p in ngrams]
+    start, end = pd.Timestamp('2018-01-01').value // 10 ** 9, pd.Timestamp('2023-12-31').value // 10 ** 9
+    authors = np.array([f'user{i}' for i in range(max(10, n_posts // 5))])
+
+    def texts(n):
+        out = []
+        for _ in range(n):
+            sentences = []
+            for _ in range(rng.integers(1, 5)):
+                words = list(rng.choice(FILLER, rng.integers(4, 12)))
+                if rng.random() < 0.5:
+                    words.insert(rng.integers(0, len(words)), phrases[rng.integers(len(phrases))])
+                sentences.append(' '.join(words).capitalize() + '.')
+            out.append(' '.join(sentences))
+        return out
+
+    os.makedirs(out_dir, exist_ok=True)
+    posts_path = os.path.join(out_dir, Config.POSTS_FILENAME)
+    comments_path = os.path.join(out_dir, Config.COMMENTS_FILENAME)
+    pd.DataFrame({
+        'title': texts(n_posts), 'body': texts(n_posts),
+        'created_utc': rng.integers(start, end, n_posts), 'author': rng.choice(authors, n_posts),
+    }).to_csv(posts_path, index=False)
+    pd.DataFrame({
+        'body': texts(2 * n_posts),
+        'created_utc': rng.integers(start, end, 2 * n_posts), 'author': rng.choice(authors, 2 * n_posts),
+    }).to_csv(comments_path, index=False)
+    return posts_path, comments_path
+
+def run_pipeline(mode, posts_path, comments_path, data_dir, extra_args):
+    report_path = os.path.join(data_dir, 'run_report.json')
+    cmd = [sys.executable, os.path.join(REPO_ROOT, 'main.py'), '--mode', mode, '--data_dir', data_dir,
+           '--posts_path', posts_path, '--comments_path', comments_path,
+           '--embedding_model', Config.HASHING_MODEL_NAME, '--report', report_path] + extra_args
+    env = dict(os.environ, HF_HUB_OFFLINE='1', TRANSFORMERS_OFFLINE='1')
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stdout[-2000:], proc.stderr[-4000:])
+        raise RuntimeError(f"main.py failed for mode={mode}")
+    with open(report_path) as f:
+        return json.load(f)
+
+def summarize(report):
+    """
+    {stage: {wall_s, rss_delta_mb, traced_peak_mb, rows_in, rows_out}} for the pipeline stages plus a
+    'total' entry with the process' peak_rss_mb.
+    """
+    stages = {}
+    for section in report['sections']:
+        if section['name'].startswith('stage:') and 'wall_s' in section:
+            stages[section['name'][len('stage:'):]] = {
+                'wall_s': section['wall_s'], 'rss_delta_mb': section.get('rss_delta_mb'),
+                'traced_peak_mb': section.get('traced_peak_mb'),
+                'rows_in': section.get('rows_in'), 'rows_out': section.get('rows_out'),
+            }
+    stages['total'] = {'wall_s': report['total_wall_s'], 'peak_rss_mb': report.get('peak_rss_mb')}
+    return stages
+
+def compare(results, baseline, tolerance, min_wall_s, min_mb):
+    """
+    Returns the list of regressions: metrics exceeding baseline x (1 + tolerance).
+    Wall times below min_wall_s and memory below min_mb are too noisy to compare and are ignored.
+    """
+    regressions = []
+    for key, stages in results.items():
+        for stage, metrics in stages.items():
+            base = baseline.get(key, {}).get(stage)
+            if not base:
+                continue
+            for metric in METRICS:
+                value, ref = metrics.get(metric), base.get(metric)
+                if value is None or ref is None:
+                    continue
+                if metric == 'wall_s' and max(value, ref) < min_wall_s:
+                    continue
+                if metric in MEMORY_METRICS and max(value, ref) < min_mb:
+                    continue
+                if value > ref * (1 + tolerance):
+                    regressions.append(f"{key} {stage} {metric}: {value} > {ref} (+{tolerance:.0%})")
+    return regressions
+
+def write_curves(results, out_dir):
+    rows = []
+    for key, stages in results.items():
+        mode, size = key.split('@')
+        for stage, metrics in stages.items():
+            rows.append({'mode': mode, 'posts': int(size), 'stage': stage, **metrics})
+    curves = pd.DataFrame(rows)
+    path = os.path.join(out_dir, 'e2e_curves.csv')
+    curves.to_csv(path, index=False)
+    return curves, path
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end scaling benchmark")
+    parser.add_argument('--sizes', type=str, default='500,2000,8000', help="Comma-separated numbers of posts (comments = 2x)")
+    parser.add_argument('--modes', type=str, default='all,topic_model', help="Comma-separated main.py modes")
+    parser.add_argument('--work_dir', type=str, default=None, help="Where corpora, outputs and results go (default: temp dir)")
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown / memory growth")
+    parser.add_argument('--min_wall_s', type=float, default=0.5, help="Ignore wall times below this (noise)")
+    parser.add_argument('--min_mb', type=float, default=16, help="Ignore stage memory below this many MB (noise)")
+    parser.add_argument('--update_baseline', '--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--pipeline_args', type=str, default='--plot_workers 2', help="Extra arguments passed to main.py")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='cog_dis_bench_')
+    sizes = [int(s) for s in args.sizes.split(',')]
+    modes = args.modes.split(',')
+    results = {}
+
+    for size in sizes:
+        posts_path, comments_path = generate_corpus(size, os.path.join(work_dir, f'corpus_{size}'))
+        for mode in modes:
+            key = f'{mode}@{size}'
+            print(f"Running {key}...")
+            report = run_pipeline(mode, posts_path, comments_path, os.path.join(work_dir, f'run_{mode}_{size}'),
+                                  args.pipeline_args.split())
+            results[key] = summarize(report)
+            total = results[key]['total']
+            print(f"  total {total['wall_s']:.1f}s, peak RSS {total['peak_rss_mb']} MB")
+
+    curves, curves_path = write_curves(results, work_dir)
+    with open(os.path.join(work_dir, 'e2e_results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    print(curves.pivot_table(index=['mode', 'stage'], columns='posts', values='wall_s').round(2).to_string())
+    print(f"Saved scaling curves to {curves_path}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Updated baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_wall_s, args.min_mb)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print("OK: within baseline" if not regressions else f"FAILED: {len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
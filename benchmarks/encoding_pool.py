@@ -0,0 +1,96 @@
+"""
+Encoding throughput at different (encoder processes x torch threads) combinations.
+
+Encodes the same sentences in-process (one process, every core) and with EncodingPool at each
+combination of the grid, and reports sentences per second and the speedup over in-process encoding.
+Pool start-up (spawning processes, loading the model) is reported separately from the encoding time.
+
+    python benchmarks/encoding_pool.py --sentences 50000 --grid 1x64,4x16,16x4,32x2,64x1
+    python benchmarks/encoding_pool.py --corpus data/processed/distortion_data.csv --model all-MiniLM-L6-v2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from src.config import Config
+from src.encoding_pool import EncodingPool, _limit_threads
+from src.topic_modeler import load_encoder
+from e2e_benchmark import FILLER
+
+def synthetic_sentences(n, seed=0):
+    """
+    Reddit-like sentence lengths: mostly short, with a long tail (4 to ~60 words).
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=2.4, sigma=0.6, size=n).astype(int), 4, 60)
+    return [' '.join(rng.choice(FILLER, length)).capitalize() + '.' for length in lengths]
+
+def default_grid(cores):
+    processes = [p for p in [1, 2, 4, 8, 16, 32, 64, 128] if p <= cores]
+    return [(p, max(1, cores // p)) for p in processes]
+
+def in_process(model_name, sentences, threads, batch_size):
+    limits = _limit_threads(threads)
+    model = load_encoder(model_name)
+    model.encode(sentences[:batch_size], batch_size=batch_size, show_progress_bar=False) # warm-up
+    start = time.perf_counter()
+    model.encode(sentences, batch_size=batch_size, show_progress_bar=False)
+    del limits
+    return time.perf_counter() - start
+
+def pooled(model_name, sentences, processes, threads, chunk_size, batch_size):
+    with EncodingPool(model_name, processes=processes, threads=threads, chunk_size=chunk_size, batch_size=batch_size) as pool:
+        pool.encode(sentences[:processes * batch_size]) # warm-up every process
+        start = time.perf_counter()
+        embeddings = pool.encode(sentences)
+        wall = time.perf_counter() - start
+        del embeddings
+        return wall, pool.startup_s
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoding pool throughput sweep")
+    parser.add_argument('--model', type=str, default=Config.MODEL_NAME, help=f"Model to encode with ('{Config.HASHING_MODEL_NAME}' = offline stand-in)")
+    parser.add_argument('--sentences', type=int, default=20000, help="Number of synthetic sentences")
+    parser.add_argument('--corpus', type=str, default=None, help="CSV with a 'sentence' column (e.g. distortion_data.csv) instead of synthetic sentences")
+    parser.add_argument('--grid', type=str, default=None, help="Comma-separated PROCESSESxTHREADS combinations (default: powers of two filling the cores)")
+    parser.add_argument('--chunk_size', type=int, default=Config.ENCODER_CHUNK_SIZE, help="Sentences per queued chunk")
+    parser.add_argument('--batch_size', type=int, default=Config.ENCODER_BATCH_SIZE, help="Encoder batch size")
+    parser.add_argument('--out', type=str, default=None, help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    if args.corpus:
+        sentences = pd.read_csv(args.corpus, usecols=['sentence'])['sentence'].dropna().astype(str).tolist()[:args.sentences]
+    else:
+        sentences = synthetic_sentences(args.sentences)
+    cores = os.cpu_count() or 1
+    grid = [tuple(int(x) for x in combo.split('x')) for combo in args.grid.split(',')] if args.grid else default_grid(cores)
+    Config.set_data_dir(tempfile.mkdtemp(prefix='cog_dis_encode_')) # the pool's temporary output matrices go here
+
+    print(f"Encoding {len(sentences)} sentences with {args.model} on {cores} core(s)...")
+    base_wall = in_process(args.model, sentences, cores, args.batch_size)
+    rows = [{'mode': 'in-process', 'processes': 1, 'threads': cores, 'startup_s': None, 'wall_s': round(base_wall, 3),
+             'sentences_per_s': round(len(sentences) / base_wall, 1), 'speedup': 1.0}]
+    for processes, threads in grid:
+        wall, startup = pooled(args.model, sentences, processes, threads, args.chunk_size, args.batch_size)
+        rows.append({'mode': 'pool', 'processes': processes, 'threads': threads, 'startup_s': round(startup, 2),
+                     'wall_s': round(wall, 3), 'sentences_per_s': round(len(sentences) / wall, 1),
+                     'speedup': round(base_wall / wall, 2)})
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'model': args.model, 'sentences': len(sentences), 'cores': cores, 'results': rows}, f, indent=2)
+        print(f"Saved results to {args.out}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
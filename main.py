@@ -1,82 +1,443 @@
 import argparse
 import os
 import sys
+import contextlib
+import numpy as np
 import pandas as pd
 from src.config import Config
 from src.data_loader import DataLoader
-from src.distortion_detector import DistortionDetector
+from src.distortion_detector import DistortionDetector, ENTRIES_COLUMN
 from src.visualizer import Visualizer
 from src.topic_modeler import TopicModeler
+from src.topic_scheduler import TopicScheduler
+from src.rollups import RollupStore
+from src.pipeline import Pipeline, Stage, file_stat
+from src.profiler import PROFILER
+from src.memory import MemoryBudget, PartitionStore, compact_frame, iter_frames
+from src.dataflow import BackgroundWriter, detection_flow
+from src.inverted_index import IndexBuilder, InvertedIndex
+from src.author_profiles import AuthorProfiles
+from src.spike_monitor import SpikeMonitor, append_events
+from src.sampling import StratifiedSampler
+from src.sharding import (SHARED_CONFIG, ShardDirectory, ShardWorker, run_shards, reduce_partitions,
+                          reduce_rollups, reduce_cooccurrence)
+
+STAGES = ['load', 'preprocess', 'map', 'detect', 'save', 'index', 'authors', 'rollups', 'cooccurrence', 'monitor', 'plot', 'cluster']
 
 def main():
     parser = argparse.ArgumentParser(description="Cognitive Distortion Analysis Pipeline")
     
     parser.add_argument('--rows', type=int, default=None, help="Number of rows to process (for testing)")
-    parser.add_argument('--posts_path', type=str, default=os.path.join(Config.RAW_DATA_DIR, Config.POSTS_FILENAME), help="Path to posts CSV")
-    parser.add_argument('--comments_path', type=str, default=os.path.join(Config.RAW_DATA_DIR, Config.COMMENTS_FILENAME), help="Path to comments CSV")
-    parser.add_argument('--mode', type=str, choices=['all', 'topic_model'], default='all', help="Analysis mode")
+    parser.add_argument('--sample', type=int, default=None, help="Sample this many rows spread evenly over weeks and source types (one streaming pass)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of --sample")
+    parser.add_argument('--posts_path', type=str, default=None, help="Path to posts CSV (default: data/raw/posts.csv)")
+    parser.add_argument('--comments_path', type=str, default=None, help="Path to comments CSV (default: data/raw/comments.csv)")
+    parser.add_argument('--mode', type=str, choices=['all', 'topic_model', 'serve', 'shard_worker', 'query', 'authors'], default='all', help="Analysis mode ('serve' = long-running scoring service, 'shard_worker' = process shards of --shard_dir, 'query' = sentences behind an entry/distortion, 'authors' = top authors / author time series)")
+    parser.add_argument('--data_dir', type=str, default=None, help="Root of the data/ tree (raw, processed, output)")
+    parser.add_argument('--embedding_model', type=str, default=None, help=f"SentenceTransformer model for topic modeling ('{Config.HASHING_MODEL_NAME}' = offline stand-in)")
+    parser.add_argument('--plot_workers', type=int, default=None, help="Processes used to render plots (default: one per core)")
+    parser.add_argument('--force_plots', action='store_true', help="Re-render every plot even if its inputs are unchanged")
+    parser.add_argument('--periods', type=str, default=None, help="Comma-separated period boundary dates (default: COVID start/end)")
+    parser.add_argument('--period_labels', type=str, default=None, help="Comma-separated labels, one more than the number of boundaries")
+    parser.add_argument('--resolution', type=str, choices=list(Config.RESOLUTIONS), default='week', help="Time series aggregation level")
+    parser.add_argument('--distinct', type=str, choices=['hll', 'exact'], default=Config.DISTINCT_MODE, help="Distinct poster counting (HyperLogLog or exact)")
+    parser.add_argument('--distinct_error', type=float, default=Config.DISTINCT_ERROR, help="Target relative error of HyperLogLog poster counts")
+    parser.add_argument('--rolling_window', type=int, default=None, help="Window of the rolling correlation plot, in periods of --resolution (default: 26)")
+    parser.add_argument('--resume', action='store_true', help="Skip stages whose inputs are unchanged, reusing cached outputs")
+    parser.add_argument('--from_stage', '--from-stage', type=str, choices=STAGES, default=None, help="Rerun this stage and everything after it")
+    parser.add_argument('--only_stage', '--only-stage', type=str, choices=STAGES, default=None, help="Rerun only this stage, using cached inputs")
+    parser.add_argument('--serve', type=str, choices=['http', 'stdin'], default='http', help="Service transport in 'serve' mode (HTTP or JSONL over stdin/stdout)")
+    parser.add_argument('--port', type=int, default=Config.SERVICE_PORT, help="HTTP port in 'serve' mode")
+    parser.add_argument('--with_clusters', action='store_true', help="In 'serve' mode, also return the nearest topic cluster (needs a topic_model run)")
+    parser.add_argument('--memory_budget', '--memory-budget', type=float, default=None, help="Memory budget in MB: compact dtypes, free intermediates early and spill partitions to disk")
+    parser.add_argument('--topic_workers', type=int, default=None, help="Processes clustering distortions in parallel in 'topic_model' mode (default: one per core)")
+    parser.add_argument('--near_dup_threshold', type=float, default=Config.NEAR_DUP_THRESHOLD, help="Collapse sentences with at least this estimated Jaccard similarity before topic modeling (0 = off)")
+    parser.add_argument('--encoder_processes', type=int, default=None, help="Processes encoding sentences for topic modeling (default: 1, in-process)")
+    parser.add_argument('--encoder_threads', type=int, default=None, help="Torch threads per encoder process (default: cores / processes)")
+    parser.add_argument('--pipelined', action='store_true', help="Overlap reading, sentence splitting, detection and writing in concurrent stages")
+    parser.add_argument('--pipeline_workers', type=int, default=0, help="With --pipelined, split and detect chunks in this many processes (default: in the stage threads)")
+    parser.add_argument('--shards', type=int, default=None, help="Split the input into this many shards processed by workers sharing --shard_dir")
+    parser.add_argument('--workers', type=int, default=None, help="Local shard worker processes (default: one per core, 0 = only external workers and the coordinator)")
+    parser.add_argument('--shard_dir', type=str, default=None, help="Shared directory coordinating sharded runs (default: data/processed/shards)")
+    parser.add_argument('--entry', type=str, default=None, help="In 'query' mode, the lexicon entry to look up (e.g. 'will never end')")
+    parser.add_argument('--distortion', type=str, default=None, help="In 'query' mode, the distortion to look up")
+    parser.add_argument('--start', type=str, default=None, help="In 'query' mode, first date (inclusive)")
+    parser.add_argument('--end', type=str, default=None, help="In 'query' mode, last date (exclusive)")
+    parser.add_argument('--limit', type=int, default=None, help="In 'query' mode, maximum number of sentences returned (in 'authors' mode, of authors, default 20)")
+    parser.add_argument('--author', type=str, default=None, help="In 'authors' mode, print this author's weekly distortion counts")
+    parser.add_argument('--merge_profiles', type=str, nargs='+', default=[], help="Author profile stores of earlier runs (.npz) merged into this run's")
+    parser.add_argument('--reset_monitor', action='store_true', help="Start the online spike monitor (state and event log) from scratch")
+    parser.add_argument('--profile', action='store_true', help="Also trace memory allocations and dump a cProfile per stage")
+    parser.add_argument('--report', type=str, default=None, help="Path of the JSON run report (default: data/output/run_report.json)")
     
     args = parser.parse_args()
+    if args.data_dir:
+        Config.set_data_dir(os.path.abspath(args.data_dir))
+    args.posts_path = args.posts_path or os.path.join(Config.RAW_DATA_DIR, Config.POSTS_FILENAME)
+    args.comments_path = args.comments_path or os.path.join(Config.RAW_DATA_DIR, Config.COMMENTS_FILENAME)
+    if args.embedding_model:
+        Config.MODEL_NAME = args.embedding_model
+    Config.DISTINCT_MODE = args.distinct
+    Config.DISTINCT_ERROR = args.distinct_error
+    Config.NEAR_DUP_THRESHOLD = args.near_dup_threshold or None
+    if args.encoder_processes:
+        Config.ENCODER_PROCESSES = args.encoder_processes
+    if args.encoder_threads:
+        Config.ENCODER_THREADS = args.encoder_threads
+    if args.rolling_window:
+        Config.ROLLING_CORR_WINDOW = args.rolling_window
+    if args.period_labels and not args.periods:
+        parser.error("--period_labels needs --periods (the default periods have their own labels)")
+    if args.periods:
+        boundaries = sorted(args.periods.split(','))
+        labels = args.period_labels.split(',') if args.period_labels else None
+        try:
+            [pd.Timestamp(boundary) for boundary in boundaries]
+        except ValueError as exc:
+            parser.error(f"--periods: {exc}")
+        if labels and len(labels) != len(boundaries) + 1:
+            parser.error(f"--period_labels: expected {len(boundaries) + 1} labels for {len(boundaries)} boundary date(s), got {len(labels)}")
+        Config.PERIOD_BOUNDARIES = boundaries
+        Config.PERIOD_LABELS = labels
+    
+    if args.sample and args.shards:
+        parser.error("--sample cannot be combined with --shards")
+    if args.mode == 'serve':
+        run_service(args)
+        return
+    if args.mode == 'query':
+        run_query(args, parser)
+        return
+    if args.mode == 'authors':
+        run_authors(args, parser)
+        return
+    if args.mode == 'shard_worker':
+        # Waits for the coordinator's plan, then processes shards until none is left
+        processed = ShardWorker(args.shard_dir or Config.SHARD_DIR).run(wait_for_plan=True)
+        print(f"Processed {processed} shard(s)")
+        return
     
     # 1. Setup
     print("Initializing components...")
     Config.ensure_directories()
+    if args.profile:
+        PROFILER.configure(trace_memory=True, cprofile_dir=Config.PROFILE_DIR)
+    pipeline = build_pipeline(args)
+    for stage in [args.from_stage, args.only_stage]:
+        if stage and stage not in pipeline.stages:
+            parser.error(f"stage '{stage}' is not part of this run (sharded runs replace load/preprocess by map, "
+                         "pipelined runs fuse them into detect)")
+    targets = ['save', 'index', 'authors', 'monitor', 'plot'] if args.mode == 'all' else ['save', 'index', 'authors', 'cluster']
+    if args.pipelined:
+        # Plot / cluster while the background writer finishes distortion_data.csv
+        targets.reverse()
+    try:
+        pipeline.run(targets=targets, resume=args.resume, from_stage=args.from_stage, only_stage=args.only_stage)
+    finally:
+        print(f"Wrote run report to {PROFILER.write_report(args.report or Config.RUN_REPORT_PATH)}")
+
+def run_query(args, parser):
+    """
+    Prints the indexed sentences matching --entry and/or --distortion between --start and --end as CSV.
+    """
+    if not (args.entry or args.distortion):
+        parser.error("'query' mode needs --entry and/or --distortion")
+    if not os.path.exists(os.path.join(Config.INDEX_DIR, 'terms.json')):
+        parser.error(f"No index in {Config.INDEX_DIR}, run the pipeline first")
+    try:
+        matches = InvertedIndex().query(entry=args.entry, distortion=args.distortion,
+                                        start=args.start, end=args.end, limit=args.limit)
+    except ValueError as exc:
+        parser.error(str(exc))
+    matches.to_csv(sys.stdout, index=False)
+    print(f"{len(matches)} sentence(s)", file=sys.stderr)
+
+def run_authors(args, parser):
+    """
+    Prints the top authors of --distortion (between --start and --end), or the weekly counts of --author, as CSV.
+    """
+    if not (args.author or args.distortion):
+        parser.error("'authors' mode needs --distortion or --author")
+    path = os.path.join(Config.PROCESSED_DATA_DIR, Config.AUTHOR_PROFILES_FILENAME)
+    if not os.path.exists(path):
+        parser.error(f"No author profiles in {path}, run the pipeline first")
+    profiles = AuthorProfiles.load(path)
+    try:
+        if args.author:
+            table = profiles.author_series(args.author, resolution=Config.RESOLUTIONS[args.resolution])
+        else:
+            table = profiles.top_authors(args.distortion, n=args.limit or 20, start=args.start, end=args.end)
+    except (KeyError, ValueError) as exc:
+        parser.error(str(exc).strip('"'))
+    table.to_csv(sys.stdout)
+
+def run_service(args):
+    """
+    Long-running scoring service: keeps the lexicon (and optionally the embedding model) warm
+    and micro-batches concurrent requests.
+    """
+    from src.service import ScoringService, serve_http, serve_stdin
+    if args.serve == 'stdin':
+        # stdout carries the JSONL responses, keep progress messages on stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            service = ScoringService(with_clusters=args.with_clusters)
+        serve_stdin(service, stdout=sys.stdout)
+    else:
+        service = ScoringService(with_clusters=args.with_clusters)
+        serve_http(service, port=args.port)
+
+def build_pipeline(args):
+    """
+    The analysis as a DAG of cached stages: load -> preprocess -> detect -> {save, rollups -> plot, cluster}.
+    """
     loader = DataLoader()
     detector = DistortionDetector()
-    visualizer = Visualizer()
-    
+    visualizer = Visualizer(plot_workers=args.plot_workers, force_plots=args.force_plots)
+    budget = MemoryBudget(args.memory_budget) if args.memory_budget else None
+
+    # Stratified sample over (week, source_type), read in one streaming pass
+    def sample():
+        print(f"Sampling {args.sample} rows (seed {args.seed})...")
+        chunks = loader.iter_chunks(args.posts_path, args.comments_path, nrows=args.rows)
+        return StratifiedSampler(args.sample, seed=args.seed).sample(chunks)
+
     # 2. Load Data
-    print(f"Loading data (Limit: {args.rows} rows)...")
-    df = loader.load_data(posts_path=args.posts_path, comments_path=args.comments_path, nrows=args.rows)
-    
-    if df.empty:
-        print("No data found! Please check data/raw/ or provide paths.")
-        return
+    def load():
+        if args.sample:
+            df = sample()
+        else:
+            print(f"Loading data (Limit: {args.rows} rows)...")
+            df = loader.load_data(posts_path=args.posts_path, comments_path=args.comments_path, nrows=args.rows)
+        if df.empty:
+            raise SystemExit("No data found! Please check data/raw/ or provide paths.")
+        if budget:
+            df = compact_frame(df, keep_columns=[Config.TEXT_COLUMN, Config.DATE_COLUMN, 'source_type', Config.AUTHOR_COLUMN])
+        return df
 
     # 3. Preprocess
-    print("Preprocessing sentences...")
-    sentences_df = loader.preprocess_sentences(df)
-    print(f"Total Sentences: {len(sentences_df)}")
-    
+    def preprocess(df):
+        print("Preprocessing sentences...")
+        if budget:
+            # Split partition by partition into a store that spills to disk when over budget
+            sentences = PartitionStore('sentences', budget.budget_bytes)
+            for start in range(0, len(df), Config.MEMORY_PARTITION_ROWS):
+                sentences.add(loader.preprocess_sentences(df.iloc[start:start + Config.MEMORY_PARTITION_ROWS]))
+        else:
+            sentences = loader.preprocess_sentences(df)
+        print(f"Total Sentences: {len(sentences)}")
+        return sentences
+
     # 4. Detect Distortions
-    print("Detecting cognitive distortions...")
-    result_df, distortion_names = detector.detect(sentences_df)
-    
+    def detect(sentences):
+        print("Detecting cognitive distortions...")
+        if not budget:
+            return detector.detect(sentences)
+        distortion_names = list(detector.distortion_dictionaries)
+        results = PartitionStore('results', budget.budget_bytes, distortion_names)
+        for frame in sentences.iter_frames():
+            if not frame.empty:
+                results.add(detector.detect(frame)[0])
+        return results, distortion_names
+
+    # 2-4 overlapped: chunks are read, split and scored by concurrent stages, results written in the background
+    writers = []
+    def stream_detect():
+        print(f"Streaming load / sentence splitting / detection (chunks of {Config.STREAM_CHUNK_ROWS} rows)...")
+        distortion_names = list(detector.distortion_dictionaries)
+        results = PartitionStore('results', budget.budget_bytes, distortion_names) if budget else []
+        writer = BackgroundWriter(os.path.join(Config.PROCESSED_DATA_DIR, Config.DISTORTION_DATA_FILENAME))
+        writers.append(writer)
+        if args.sample:
+            sampled = sample()
+            chunks = (sampled.iloc[start:start + Config.STREAM_CHUNK_ROWS]
+                      for start in range(0, len(sampled), Config.STREAM_CHUNK_ROWS))
+        else:
+            chunks = loader.iter_chunks(args.posts_path, args.comments_path, nrows=args.rows)
+        try:
+            for result_df in detection_flow(loader, detector, workers=args.pipeline_workers).run(chunks):
+                writer.put(result_df.drop(columns=[ENTRIES_COLUMN]))
+                if budget:
+                    results.add(result_df)
+                else:
+                    results.append(result_df)
+        finally:
+            writer.close()
+        if not len(results):
+            raise SystemExit("No data found! Please check data/raw/ or provide paths.")
+        if not budget:
+            results = pd.concat(results, ignore_index=True)
+        print(f"Total Sentences: {len(results)}")
+        return results, distortion_names
+
     # Save intermediate result
-    output_path = os.path.join(Config.PROCESSED_DATA_DIR, Config.DISTORTION_DATA_FILENAME)
-    result_df.to_csv(output_path, index=False)
-    print(f"Saved processed data to {output_path}")
+    def save(detected):
+        if writers:
+            # Written by the streaming run's background writer
+            output_path = writers.pop().wait()
+        else:
+            result, _ = detected
+            output_path = os.path.join(Config.PROCESSED_DATA_DIR, Config.DISTORTION_DATA_FILENAME)
+            for i, frame in enumerate(iter_frames(result)):
+                frame = frame.drop(columns=[ENTRIES_COLUMN], errors='ignore') # only kept for the index
+                frame.to_csv(output_path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        print(f"Saved processed data to {output_path}")
+        return [output_path]
+
+    # Daily rollups, from which any coarser time series view is derived
+    def rollups(detected):
+        result, distortion_names = detected
+        store = RollupStore(distortion_names)
+        for frame in iter_frames(result):
+            store.add_frame(frame)
+        print(f"Saved daily rollups to {store.save()}")
+        return store
+
+    # Online spike detection: consumes the new complete weeks of the rollups, state persisted across runs
+    def monitor(store):
+        if args.rows or args.sample:
+            # Partial data would move the persisted state past weeks the full runs have not seen
+            print("Spike monitor: skipped (--rows / --sample runs do not update the persisted state)")
+            return []
+        state_path = os.path.join(Config.PROCESSED_DATA_DIR, Config.SPIKE_MONITOR_FILENAME)
+        if args.reset_monitor or not os.path.exists(state_path):
+            if os.path.exists(Config.SPIKE_EVENTS_PATH):
+                os.remove(Config.SPIKE_EVENTS_PATH)
+            spike_monitor = SpikeMonitor(store.distortion_names)
+        else:
+            spike_monitor = SpikeMonitor.load(state_path)
+            if spike_monitor.distortion_names != store.distortion_names:
+                raise ValueError(f"Spike monitor state {state_path} has other distortions, rerun with --reset_monitor")
+        events = spike_monitor.update(store)
+        events_path = append_events(events)
+        spike_monitor.save(state_path)
+        print(f"Spike monitor: {len(events)} new spike(s) through the week of {spike_monitor.last_week.date() if spike_monitor.last_week is not None else '-'}"
+              f" (week of {spike_monitor.pending_week.date() if spike_monitor.pending_week is not None else '-'} held back), events in {events_path}")
+        return [events_path, state_path]
+
+    # Inverted index from lexicon entries / distortions to the flagged sentences, for drill-down queries
+    def index(detected):
+        result, distortion_names = detected
+        return [IndexBuilder(detector).add(result, distortion_names).write()]
+
+    # Per-author weekly distortion counts, merged with the stores of earlier runs
+    def authors(detected):
+        result, distortion_names = detected
+        profiles = AuthorProfiles.from_frames(result, distortion_names)
+        for path in args.merge_profiles:
+            profiles.merge(AuthorProfiles.load(path))
+        path = profiles.save()
+        print(f"Saved profiles of {len(profiles)} authors to {path}")
+        return [path]
+
+    # Per-comment distortion co-occurrence counts, per period
+    def cooccurrence(detected):
+        result, distortion_names = detected
+        return visualizer.comment_cooccurrence(result, distortion_names)
 
     # 5. Visualization
-    if args.mode == 'all':
+    def plot(store, cooc):
         print("Generating Visualizations...")
+        distortion_names = store.distortion_names
         
         # Prepare Data (Raw, Norm, Spikes)
-        weekly_data = visualizer.prepare_time_series(result_df, distortion_names)
-        
-        # A. Individual Trends
-        visualizer.plot_time_series(weekly_data)
-        
-        # B. Combined "Suman" Plot
-        visualizer.plot_combined_trends(weekly_data)
-        
-        # C. Correlation Matrices (Before/During/After x Raw/Norm/Spikes)
-        visualizer.plot_correlation_matrices(weekly_data)
+        weekly_data = visualizer.prepare_time_series(None, distortion_names,
+                                                     resolution=Config.RESOLUTIONS[args.resolution], rollups=store)
         
-        # D. Per-Comment Correlation Matrices
-        visualizer.plot_per_comment_correlations(result_df, distortion_names)
-        
-    # 6. Topic Modeling (Optional or if specialized mode)
-    # Only run if explicitly asked or if 'all' includes it (might be slow for 'all')
-    if args.mode == 'topic_model':
+        # A. Individual Trends, B. Combined "Suman" Plot,
+        # C. Correlation Matrices (Before/During/After x Raw/Norm/Spikes) + rolling correlation, D. Per-Comment Correlation Matrices
+        # All rendered as independent jobs in one process pool
+        return visualizer.plot_all(weekly_data, None, distortion_names, cooc=cooc, resolution=Config.RESOLUTIONS[args.resolution])
+
+    # 6. Topic Modeling (Only in 'topic_model' mode, might be slow for 'all')
+    def cluster(detected):
+        result, distortion_names = detected
+        print("Running Topic Modeling...")
         modeler = TopicModeler()
-        for distortion in distortion_names:
-            print(f"Running Topic Modeling for {distortion}...")
-            clustered_df = modeler.run_clustering(result_df, distortion)
-            if clustered_df is not None:
-                cluster_path = os.path.join(Config.TABLES_DIR, f'topics_{distortion.replace(" ", "_")}.csv')
-                clustered_df.to_csv(cluster_path, index=False)
-                print(f"Saved clusters to {cluster_path}")
+        try:
+            clustered = TopicScheduler(modeler, workers=args.topic_workers).run(result, distortion_names)
+        finally:
+            modeler.close()
+        paths = []
+        for distortion, clustered_df in clustered.items():
+            cluster_path = os.path.join(Config.TABLES_DIR, f'topics_{distortion.replace(" ", "_")}.csv')
+            clustered_df.to_csv(cluster_path, index=False)
+            centroids_path = cluster_path.replace('.csv', '_centroids.npy')
+            np.save(centroids_path, modeler.centroids[distortion])
+            print(f"Saved clusters to {cluster_path}")
+            paths.extend([cluster_path, centroids_path])
+        return paths
+
+    def files_exist(paths):
+        return all(os.path.exists(path) for path in paths)
+
+    def partitions_exist(output):
+        store = output[0] if isinstance(output, tuple) else output
+        return not isinstance(store, PartitionStore) or store.exists()
+
+    if args.shards:
+        # Map: shards are loaded, split and scored by worker processes (or hosts) sharing args.shard_dir
+        directory = ShardDirectory(args.shard_dir or Config.SHARD_DIR)
+
+        def map_shards():
+            return run_shards(directory, args.posts_path, args.comments_path, args.shards,
+                              workers=args.workers, nrows=args.rows)
+
+        # Reduce: merge the shards' partials into the outputs of the single-node stages
+        def reduce_rollups_stage(directory):
+            store = reduce_rollups(directory)
+            print(f"Saved daily rollups to {store.save()}")
+            return store
+
+        upstream = [
+            Stage('map', map_shards, params=lambda: {'posts': file_stat(args.posts_path),
+                                                     'comments': file_stat(args.comments_path),
+                                                     'rows': args.rows, 'shards': args.shards,
+                                                     'lexicon': detector.distortion_dictionaries},
+                  config_keys=SHARED_CONFIG, valid=lambda directory: directory.complete()),
+            Stage('detect', reduce_partitions, deps=['map'], valid=partitions_exist),
+            Stage('rollups', reduce_rollups_stage, deps=['map']),
+            Stage('cooccurrence', reduce_cooccurrence, deps=['map']),
+        ]
+    elif args.pipelined:
+        upstream = [
+            Stage('detect', stream_detect, params=lambda: {'posts': file_stat(args.posts_path),
+                                                           'comments': file_stat(args.comments_path),
+                                                           'rows': args.rows, 'memory_budget': args.memory_budget,
+                                                           'sample': args.sample, 'seed': args.seed,
+                                                           'lexicon': detector.distortion_dictionaries},
+                  config_keys=['STREAM_CHUNK_ROWS'], valid=partitions_exist),
+            Stage('rollups', rollups, deps=['detect'], config_keys=['DISTINCT_MODE', 'DISTINCT_ERROR']),
+            Stage('cooccurrence', cooccurrence, deps=['detect'], config_keys=['PERIOD_BOUNDARIES', 'PERIOD_LABELS']),
+        ]
+    else:
+        upstream = [
+            Stage('load', load, params=lambda: {'posts': file_stat(args.posts_path),
+                                                'comments': file_stat(args.comments_path),
+                                                'rows': args.rows, 'memory_budget': args.memory_budget,
+                                                'sample': args.sample, 'seed': args.seed}),
+            Stage('preprocess', preprocess, deps=['load'], config_keys=['MEMORY_PARTITION_ROWS'], valid=partitions_exist),
+            Stage('detect', detect, deps=['preprocess'], params={'lexicon': detector.distortion_dictionaries},
+                  valid=partitions_exist),
+            Stage('rollups', rollups, deps=['detect'], config_keys=['DISTINCT_MODE', 'DISTINCT_ERROR']),
+            Stage('cooccurrence', cooccurrence, deps=['detect'], config_keys=['PERIOD_BOUNDARIES', 'PERIOD_LABELS']),
+        ]
+
+    return Pipeline(upstream + [
+        Stage('save', save, deps=['detect'], valid=files_exist),
+        Stage('index', index, deps=['detect'], valid=files_exist),
+        Stage('authors', authors, deps=['detect'], config_keys=['AUTHOR_PROFILE_EXCLUDE'],
+              params=lambda: {'merge_profiles': [file_stat(path) for path in args.merge_profiles]}, valid=files_exist),
+        Stage('monitor', monitor, deps=['rollups'], config_keys=['SPIKE_WINDOW', 'SPIKE_SOURCE_TYPES'],
+              params={'reset': args.reset_monitor, 'rows': args.rows, 'sample': args.sample, 'seed': args.seed},
+              valid=files_exist),
+        Stage('plot', plot, deps=['rollups', 'cooccurrence'],
+              config_keys=['PLOT_STYLE', 'PERIOD_BOUNDARIES', 'PERIOD_LABELS', 'COVID_START_DATE', 'COVID_END_DATE',
+                           'ROLLING_CORR_WINDOW', 'ROLLING_CORR_PAIRS'],
+              params={'resolution': args.resolution}, valid=files_exist),
+        Stage('cluster', cluster, deps=['detect'],
+              config_keys=['MODEL_NAME', 'CLUSTERS_K_MIN', 'CLUSTERS_K_MAX', 'CLUSTERS_K_STEP', 'NEAR_DUP_THRESHOLD',
+                           'NEAR_DUP_PERMUTATIONS', 'NEAR_DUP_SHINGLE_SIZE'], valid=files_exist),
+    ], hooks=[budget.report] if budget else None)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,124 @@
+"""
+Streaming library API: score texts for cognitive distortions without building DataFrames.
+
+    from src.api import score_texts
+    for result in score_texts(({'text': msg.value, 'offset': msg.offset} for msg in consumer), only_flagged=True):
+        print(result.meta['offset'], result.mask, result.entries)
+"""
+import asyncio
+from collections import namedtuple
+from .config import Config
+from .data_loader import DataLoader
+from .distortion_detector import DistortionDetector
+
+# One scored sentence. doc_index counts input items, mask has bit i set for distortion i of DistortionDetector.lexicon,
+# entries are the matched (distortion, ngram) pairs and meta is the metadata of the input item.
+SentenceResult = namedtuple('SentenceResult', ['doc_index', 'sentence_index', 'sentence', 'mask', 'entries', 'meta'])
+
+_DEFAULTS = {}
+
+def _components(detector=None, splitter=None):
+    """
+    The detector and sentence splitter, loaded once per process and reused across calls.
+    """
+    if detector is None:
+        if 'detector' not in _DEFAULTS:
+            _DEFAULTS['detector'] = DistortionDetector()
+        detector = _DEFAULTS['detector']
+    if splitter is None:
+        if 'splitter' not in _DEFAULTS:
+            _DEFAULTS['splitter'] = DataLoader().sent_tokenize
+        splitter = _DEFAULTS['splitter']
+    return detector, splitter
+
+def _unpack(item):
+    """
+    Accepts a text, a (text, meta) pair or a dict with a 'text' key (the other keys become meta).
+    """
+    if isinstance(item, str):
+        return item, None
+    if isinstance(item, dict):
+        meta = {key: value for key, value in item.items() if key != Config.TEXT_COLUMN}
+        return item.get(Config.TEXT_COLUMN) or '', meta
+    text, meta = item
+    return text, meta
+
+def _split(doc_index, item, splitter):
+    text, meta = _unpack(item)
+    text = str(text)
+    if not text.strip():
+        return []
+    return [(doc_index, i, sentence, meta) for i, sentence in enumerate(splitter(text))]
+
+def _score_batch(batch, detector, with_entries, only_flagged):
+    results = []
+    for doc_index, sentence_index, sentence, meta in batch:
+        mask, entries = detector.score(sentence, with_entries=with_entries)
+        if mask or not only_flagged:
+            results.append(SentenceResult(doc_index, sentence_index, sentence, mask, entries, meta))
+    return results
+
+def score_texts(items, batch_size=None, with_entries=True, only_flagged=False, detector=None, splitter=None):
+    """
+    Lazily splits an iterable of texts into sentences, scores them and yields a SentenceResult per sentence
+    (only those with a distortion if only_flagged). Nothing is read from items before the first result is
+    requested, and the results of an item are yielded before the next item is read, so a slow source never
+    holds results back; batch_size only bounds the sentences scored at once within a long text.
+    """
+    batch_size = batch_size or Config.API_BATCH_SIZE
+    detector, splitter = _components(detector, splitter)
+    for doc_index, item in enumerate(items):
+        sentences = _split(doc_index, item, splitter)
+        for start in range(0, len(sentences), batch_size):
+            yield from _score_batch(sentences[start:start + batch_size], detector, with_entries, only_flagged)
+
+async def _anext(iterator):
+    try:
+        return True, await iterator.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+async def ascore_texts(items, batch_size=None, with_entries=True, only_flagged=False, detector=None, splitter=None,
+                       max_wait_ms=None):
+    """
+    Async variant of score_texts for async iterables (e.g. an aiokafka consumer).
+    Sentences are scored in batches in the default executor so the event loop keeps running. A batch is
+    scored when it reaches batch_size sentences or when its first sentence has waited max_wait_ms, also
+    while items is idle: a result is held back for at most max_wait_ms plus the scoring time.
+    """
+    batch_size = batch_size or Config.API_BATCH_SIZE
+    max_wait = (max_wait_ms if max_wait_ms is not None else Config.API_MAX_WAIT_MS) / 1000
+    detector, splitter = _components(detector, splitter)
+    loop = asyncio.get_running_loop()
+    iterator = items.__aiter__()
+    pending = None
+    batch = []
+    deadline = None
+    doc_index = 0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(_anext(iterator))
+            timeout = max(0, deadline - loop.time()) if batch else None
+            done, _ = await asyncio.wait([pending], timeout=timeout)
+            if done:
+                more, item = pending.result()
+                pending = None
+                if not more:
+                    break
+                if not batch:
+                    deadline = loop.time() + max_wait
+                batch.extend(_split(doc_index, item, splitter))
+                doc_index += 1
+                if len(batch) < batch_size and loop.time() < deadline:
+                    continue
+            if batch:
+                for result in await loop.run_in_executor(None, _score_batch, batch, detector, with_entries, only_flagged):
+                    yield result
+                batch = []
+        if batch:
+            for result in await loop.run_in_executor(None, _score_batch, batch, detector, with_entries, only_flagged):
+                yield result
+    finally:
+        if pending is not None:
+            pending.cancel()
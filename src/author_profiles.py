@@ -0,0 +1,184 @@
+import os
+import numpy as np
+import pandas as pd
+from .config import Config
+from .memory import iter_frames
+
+# Weeks run Monday to Sunday and are labelled by their Sunday, like resample('W')
+_FIRST_MONDAY = np.datetime64('1970-01-05', 'D')
+
+def week_ids(dates):
+    days = pd.to_datetime(dates).to_numpy(dtype='datetime64[D]')
+    return ((days - _FIRST_MONDAY).astype(np.int64) // 7).astype(np.int32)
+
+def week_labels(weeks):
+    return pd.to_datetime(_FIRST_MONDAY + np.asarray(weeks, dtype=np.int64) * 7 + 6)
+
+class AuthorProfiles:
+    """
+    Sparse author x week x distortion sentence counts. Authors are int-coded (self.authors[code] is the name);
+    the (author, week) cells are stored CSR-style: the cells of author a are indptr[a]:indptr[a + 1], sorted
+    by week, with their distortion counts (cells x distortions) and total number of sentences.
+    Frames and other stores are buffered as COO cells and folded into the CSR arrays on the next query.
+    """
+    def __init__(self, distortion_names):
+        self.distortion_names = list(distortion_names)
+        self.authors = []
+        self.codes = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.weeks = np.zeros(0, dtype=np.int32)
+        self.counts = np.zeros((0, len(self.distortion_names)), dtype=np.uint32)
+        self.sentences = np.zeros(0, dtype=np.uint32)
+        self._pending = []
+
+    @classmethod
+    def from_frames(cls, result, distortion_names):
+        """
+        Built in one pass over detection results (a DataFrame or a PartitionStore).
+        """
+        profiles = cls(distortion_names)
+        for frame in iter_frames(result):
+            profiles.add_frame(frame)
+        return profiles
+
+    def _code(self, names):
+        local, uniques = pd.factorize(np.asarray(names, dtype=object))
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, name in enumerate(uniques):
+            code = self.codes.get(name)
+            if code is None:
+                code = self.codes[name] = len(self.authors)
+                self.authors.append(name)
+            mapping[i] = code
+        return mapping[local]
+
+    def add_frame(self, df):
+        """
+        Adds sentence-level detection results (date, author and boolean distortion columns).
+        Rows without a date or an author, and excluded authors (e.g. '[deleted]'), are ignored.
+        """
+        if Config.AUTHOR_COLUMN not in df.columns or df.empty:
+            return self
+        df = df.dropna(subset=[Config.DATE_COLUMN, Config.AUTHOR_COLUMN])
+        authors = df[Config.AUTHOR_COLUMN].astype(object).astype(str)
+        keep = ~authors.isin(Config.AUTHOR_PROFILE_EXCLUDE).to_numpy()
+        if not keep.any():
+            return self
+        df, authors = df[keep], authors[keep]
+        cells = pd.DataFrame(df[self.distortion_names].to_numpy(dtype=np.uint32), columns=self.distortion_names)
+        cells['_author'] = self._code(authors.to_numpy())
+        cells['_week'] = week_ids(df[Config.DATE_COLUMN])
+        cells['_sentences'] = np.uint32(1)
+        summed = cells.groupby(['_author', '_week'], sort=False).sum()
+        self._pending.append((summed.index.get_level_values('_author').to_numpy(dtype=np.int64),
+                              summed.index.get_level_values('_week').to_numpy(dtype=np.int32),
+                              summed[self.distortion_names].to_numpy(dtype=np.uint32),
+                              summed['_sentences'].to_numpy(dtype=np.uint32)))
+        return self
+
+    def merge(self, other):
+        """
+        Adds another store (e.g. from an earlier run or another shard); authors are matched by name.
+        """
+        if other.distortion_names != self.distortion_names:
+            raise ValueError("Cannot merge author profiles with different distortions")
+        other._compact()
+        if len(other.weeks):
+            mapping = self._code(np.array(other.authors, dtype=object))
+            rows = np.repeat(np.arange(len(other.authors)), np.diff(other.indptr))
+            self._pending.append((mapping[rows], other.weeks, other.counts, other.sentences))
+        return self
+
+    def _compact(self):
+        if not self._pending:
+            return
+        rows = [np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))] + [p[0] for p in self._pending]
+        rows = np.concatenate(rows)
+        weeks = np.concatenate([self.weeks] + [p[1] for p in self._pending])
+        counts = np.concatenate([self.counts] + [p[2] for p in self._pending])
+        sentences = np.concatenate([self.sentences] + [p[3] for p in self._pending])
+        self._pending = []
+
+        # Sort cells by (author, week) and sum duplicates
+        order = np.lexsort((weeks, rows))
+        rows, weeks, counts, sentences = rows[order], weeks[order], counts[order], sentences[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (weeks[1:] != weeks[:-1])
+        starts = np.flatnonzero(first)
+        if len(starts):
+            counts = np.add.reduceat(counts, starts, axis=0).astype(np.uint32)
+            sentences = np.add.reduceat(sentences, starts).astype(np.uint32)
+        self.weeks = weeks[starts].astype(np.int32)
+        self.counts, self.sentences = counts, sentences
+        self.indptr = np.searchsorted(rows[starts], np.arange(len(self.authors) + 1)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.authors)
+
+    def totals(self, start=None, end=None):
+        """
+        Per-author distortion counts and sentences, as a DataFrame indexed by author.
+        start / end restrict it to the weeks labelled (by their Sunday) start <= week < end.
+        """
+        self._compact()
+        rows = np.repeat(np.arange(len(self.authors)), np.diff(self.indptr))
+        values = np.column_stack([self.counts, self.sentences])
+        if start is not None or end is not None:
+            labels = week_labels(self.weeks)
+            cells = np.ones(len(rows), dtype=bool)
+            if start is not None:
+                cells &= labels >= pd.Timestamp(start)
+            if end is not None:
+                cells &= labels < pd.Timestamp(end)
+            rows, values = rows[cells], values[cells]
+        sums = np.column_stack([np.bincount(rows, weights=values[:, j], minlength=len(self.authors))
+                                for j in range(values.shape[1])]).astype(np.int64)
+        return pd.DataFrame(sums, index=pd.Index(self.authors, name='author'),
+                            columns=self.distortion_names + ['sentences'])
+
+    def top_authors(self, distortion, n=10, by='count', min_sentences=1, start=None, end=None):
+        """
+        The n authors with the most sentences of distortion (by='count') or the highest share of their
+        sentences with it (by='share', among authors with at least min_sentences sentences).
+        """
+        if distortion not in self.distortion_names:
+            raise ValueError(f"Unknown distortion '{distortion}'")
+        totals = self.totals(start, end)[[distortion, 'sentences']].rename(columns={distortion: 'count'})
+        totals = totals[totals['sentences'] >= min_sentences]
+        totals['share'] = totals['count'] / totals['sentences']
+        return totals.sort_values([by, 'sentences'], ascending=False).head(n)
+
+    def author_series(self, author, resolution='W'):
+        """
+        Weekly distortion counts and sentences of one author (resolution: a pandas offset alias to re-aggregate).
+        Weeks without sentences are included as zeros.
+        """
+        self._compact()
+        if author not in self.codes:
+            raise KeyError(f"Unknown author '{author}'")
+        a = self.codes[author]
+        cells = slice(self.indptr[a], self.indptr[a + 1])
+        series = pd.DataFrame(np.column_stack([self.counts[cells], self.sentences[cells]]).astype(np.int64),
+                              index=pd.DatetimeIndex(week_labels(self.weeks[cells]), name='week'),
+                              columns=self.distortion_names + ['sentences'])
+        return series.resample(resolution).sum()
+
+    def save(self, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.AUTHOR_PROFILES_FILENAME)
+        self._compact()
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, distortion_names=np.array(self.distortion_names), authors=np.array(self.authors, dtype=str),
+                            indptr=self.indptr, weeks=self.weeks, counts=self.counts, sentences=self.sentences)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.AUTHOR_PROFILES_FILENAME)
+        with np.load(path) as data:
+            profiles = cls(data['distortion_names'].tolist())
+            profiles.authors = data['authors'].tolist()
+            profiles.codes = {name: i for i, name in enumerate(profiles.authors)}
+            profiles.indptr, profiles.weeks = data['indptr'], data['weeks']
+            profiles.counts, profiles.sentences = data['counts'], data['sentences']
+        return profiles
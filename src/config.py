@@ -6,6 +6,10 @@ class Config:
     DATA_DIR = os.path.join(BASE_DIR, 'data')
     RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
     PROCESSED_DATA_DIR = os.path.join(DATA_DIR, 'processed')
+    CACHE_DIR = os.path.join(PROCESSED_DATA_DIR, 'cache')
+    SPILL_DIR = os.path.join(PROCESSED_DATA_DIR, 'spill')
+    SHARD_DIR = os.path.join(PROCESSED_DATA_DIR, 'shards')
+    INDEX_DIR = os.path.join(PROCESSED_DATA_DIR, 'index')
     OUTPUT_DIR = os.path.join(DATA_DIR, 'output')
     PLOTS_DIR = os.path.join(OUTPUT_DIR, 'plots')
     PLOT_CORR_DIR = os.path.join(PLOTS_DIR, 'correlation')
@@ -13,6 +17,9 @@ class Config:
     PLOT_TS_NORM_DIR = os.path.join(PLOTS_DIR, 'time_series', 'normalized')
     PLOT_TS_SPIKES_DIR = os.path.join(PLOTS_DIR, 'time_series', 'spikes')
     TABLES_DIR = os.path.join(OUTPUT_DIR, 'tables')
+    PROFILE_DIR = os.path.join(OUTPUT_DIR, 'profile')
+    RUN_REPORT_PATH = os.path.join(OUTPUT_DIR, 'run_report.json')
+    SPIKE_EVENTS_PATH = os.path.join(OUTPUT_DIR, 'spike_events.jsonl')
     
     # File Names (Expected Input)
     POSTS_FILENAME = 'posts.csv'
@@ -21,28 +28,116 @@ class Config:
     # Output Filenames
     MERGED_DATA_FILENAME = 'merged_data.csv'
     DISTORTION_DATA_FILENAME = 'distortion_data.csv'
+    ROLLUPS_FILENAME = 'rollups.pkl'
+    AUTHOR_PROFILES_FILENAME = 'author_profiles.npz'
+    SPIKE_MONITOR_FILENAME = 'spike_monitor.pkl'
 
     # Columns
     TEXT_COLUMN = 'text'
     DATE_COLUMN = 'date'
     AUTHOR_COLUMN = 'author'
+    AUTHOR_PROFILE_EXCLUDE = ['[deleted]', '[removed]'] # placeholder authors left out of author profiles
     
     # Model
     MODEL_NAME = 'all-mpnet-base-v2'
+    HASHING_MODEL_NAME = 'hashing' # offline stand-in encoder for tests and benchmarks
+    ENCODER_PROCESSES = 1 # processes encoding sentences in parallel (1 = in the calling process)
+    ENCODER_THREADS = None # torch threads per encoder process; None = cores / processes
+    ENCODER_CHUNK_SIZE = 512 # sentences per queued chunk (chunks are cut from length-sorted sentences)
+    ENCODER_BATCH_SIZE = 32
     
     # Analysis
     CLUSTERS_K_MIN = 10
     CLUSTERS_K_MAX = 100
     CLUSTERS_K_STEP = 10
+    TOPIC_WORKERS = None # processes clustering distortions in parallel; None = one per core
+
+    # Near-duplicate collapsing before topic modeling: one embedding per group, group sizes as KMeans weights
+    NEAR_DUP_THRESHOLD = 0.8 # estimated Jaccard similarity of character shingles; None = no collapsing
+    NEAR_DUP_PERMUTATIONS = 128 # MinHash signature length
+    NEAR_DUP_SHINGLE_SIZE = 5 # characters
+    NEAR_DUP_BATCH = 20000 # sentences hashed at once
+    NEAR_DUP_MAX_BUCKET = 64 # LSH buckets up to this size are verified pairwise
+    
+    # Distinct poster counting: 'hll' (HyperLogLog, mergeable, bounded error) or 'exact' (for validation)
+    DISTINCT_MODE = 'hll'
+    DISTINCT_ERROR = 0.01 # target relative standard error of the HyperLogLog estimate
+    
+    # Online spike monitor: same rule as the batch spike series (previous SPIKE_WINDOW weeks), per source type
+    SPIKE_WINDOW = 4
+    SPIKE_SOURCE_TYPES = ['all', 'post', 'comment'] # 'all' = posts and comments together
+
+    # Time series resolutions (pandas offset aliases)
+    RESOLUTIONS = {'day': 'D', 'week': 'W', 'month': 'MS'}
+    
+    # Plotting
+    PLOT_STYLE = 'seaborn-v0_8-whitegrid'
+    PLOT_WORKERS = None # None = one process per core
+    RENDER_MANIFEST_PATH = os.path.join(PLOTS_DIR, 'render_manifest.json')
+    
+    # Scoring service
+    SERVICE_HOST = '127.0.0.1'
+    SERVICE_PORT = 8765
+    SERVICE_MAX_BATCH = 256 # texts per micro-batch
+    SERVICE_MAX_WAIT_MS = 10 # latency budget for filling a micro-batch
+    
+    # Streaming API
+    API_BATCH_SIZE = 512 # sentences scored per batch
+    API_MAX_WAIT_MS = 50 # ascore_texts: longest a sentence waits for its batch to fill
+    
+    # Memory-budgeted mode (--memory_budget)
+    MEMORY_PARTITION_ROWS = 50000 # input rows per partition
+    MEMORY_PARTITION_SHARE = 0.5 # share of the budget partitions may hold in memory before spilling to disk
+    
+    # Pipelined execution (--pipelined): chunked stages connected by bounded queues
+    STREAM_CHUNK_ROWS = 5000 # input rows per chunk
+    STREAM_QUEUE_SIZE = 4 # chunks buffered between two stages before the upstream one blocks
+    
+    # Sharded execution (--shards); coordination happens through files in SHARD_DIR
+    SHARD_POLL_S = 2 # how often the coordinator and idle workers check the shard directory
+    SHARD_CLAIM_TIMEOUT_S = 3600 # a claim older than this without a result is taken over
     
     # Dates
     COVID_START_DATE = '2020-04-07'
     COVID_END_DATE = '2022-01-01'
     
+    # Period boundaries used to split correlation/co-occurrence analyses
+    PERIOD_BOUNDARIES = [COVID_START_DATE, COVID_END_DATE]
+    PERIOD_LABELS = None # None = Before/During/After for two boundaries, else derived from the dates
+    
+    # Rolling correlation
+    ROLLING_CORR_WINDOW = 26 # periods of the time series resolution (weeks by default)
+    ROLLING_CORR_PAIRS = None # list of (distortion, distortion); None = strongest pairs
+    
+    @staticmethod
+    def set_data_dir(data_dir):
+        """
+        Points every data, cache and output path at data_dir (e.g. for isolated benchmark runs).
+        """
+        Config.DATA_DIR = data_dir
+        Config.RAW_DATA_DIR = os.path.join(data_dir, 'raw')
+        Config.PROCESSED_DATA_DIR = os.path.join(data_dir, 'processed')
+        Config.CACHE_DIR = os.path.join(Config.PROCESSED_DATA_DIR, 'cache')
+        Config.SPILL_DIR = os.path.join(Config.PROCESSED_DATA_DIR, 'spill')
+        Config.SHARD_DIR = os.path.join(Config.PROCESSED_DATA_DIR, 'shards')
+        Config.INDEX_DIR = os.path.join(Config.PROCESSED_DATA_DIR, 'index')
+        Config.OUTPUT_DIR = os.path.join(data_dir, 'output')
+        Config.PLOTS_DIR = os.path.join(Config.OUTPUT_DIR, 'plots')
+        Config.PLOT_CORR_DIR = os.path.join(Config.PLOTS_DIR, 'correlation')
+        Config.PLOT_TS_RAW_DIR = os.path.join(Config.PLOTS_DIR, 'time_series', 'raw')
+        Config.PLOT_TS_NORM_DIR = os.path.join(Config.PLOTS_DIR, 'time_series', 'normalized')
+        Config.PLOT_TS_SPIKES_DIR = os.path.join(Config.PLOTS_DIR, 'time_series', 'spikes')
+        Config.TABLES_DIR = os.path.join(Config.OUTPUT_DIR, 'tables')
+        Config.PROFILE_DIR = os.path.join(Config.OUTPUT_DIR, 'profile')
+        Config.RUN_REPORT_PATH = os.path.join(Config.OUTPUT_DIR, 'run_report.json')
+        Config.SPIKE_EVENTS_PATH = os.path.join(Config.OUTPUT_DIR, 'spike_events.jsonl')
+        Config.RENDER_MANIFEST_PATH = os.path.join(Config.PLOTS_DIR, 'render_manifest.json')
+
     @staticmethod
     def ensure_directories():
         os.makedirs(Config.RAW_DATA_DIR, exist_ok=True)
         os.makedirs(Config.PROCESSED_DATA_DIR, exist_ok=True)
+        os.makedirs(Config.CACHE_DIR, exist_ok=True)
         os.makedirs(Config.TABLES_DIR, exist_ok=True)
         os.makedirs(Config.PLOT_CORR_DIR, exist_ok=True)
         os.makedirs(Config.PLOT_TS_RAW_DIR, exist_ok=True)
@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+from .config import Config
+
+METRICS = ['count', 'phi', 'lift', 'pmi']
+
+def default_period_labels(boundaries):
+    """
+    Before/During/After for the two COVID boundaries, otherwise labels built from the boundary dates.
+    """
+    if len(boundaries) == 2:
+        return ['Before', 'During', 'After']
+    edges = ['start'] + [pd.to_datetime(b).strftime('%Y-%m-%d') for b in boundaries] + ['end']
+    return [f'{a}_to_{b}' for a, b in zip(edges[:-1], edges[1:])]
+
+def period_ranges(boundaries=None, labels=None):
+    """
+    Returns {label: (start, end)} for the periods delimited by the sorted boundaries.
+    The first period has no start and the last has no end.
+    """
+    boundaries = list(Config.PERIOD_BOUNDARIES if boundaries is None else boundaries)
+    labels = list(labels or Config.PERIOD_LABELS or default_period_labels(boundaries))
+    if len(labels) != len(boundaries) + 1:
+        raise ValueError(f"Expected {len(boundaries) + 1} period labels, got {len(labels)}")
+    edges = [None] + boundaries + [None]
+    return {label: (edges[i], edges[i + 1]) for i, label in enumerate(labels)}
+
+class CooccurrenceCounts:
+    """
+    Per-period distortion co-occurrence counts: the number of rows and XᵀX of the 0/1 distortion matrix.
+    Counts from different chunks can be merged; metrics are derived from the counts alone.
+    """
+    def __init__(self, distortion_names, boundaries=None, labels=None):
+        self.distortion_names = list(distortion_names)
+        self.periods = period_ranges(boundaries, labels)
+        self.labels = list(self.periods.keys())
+        self.boundaries = pd.to_datetime([start for start, _ in self.periods.values() if start is not None])
+        d = len(self.distortion_names)
+        self.n = np.zeros(len(self.labels), dtype=np.int64)
+        self.pairs = np.zeros((len(self.labels), d, d), dtype=np.int64)
+
+    def add_frame(self, df):
+        """
+        Adds the rows of df (date column + one boolean column per distortion), assigning periods in one pass.
+        Rows without a date are ignored.
+        """
+        dates = pd.to_datetime(df[Config.DATE_COLUMN]).to_numpy(dtype='datetime64[ns]')
+        valid = ~np.isnat(dates)
+        period_idx = np.searchsorted(self.boundaries.to_numpy(dtype='datetime64[ns]'), dates[valid], side='right')
+        X = df[self.distortion_names].to_numpy(dtype=np.float64)[valid]
+
+        # Group rows by period once, then one XᵀX product per period
+        order = np.argsort(period_idx, kind='stable')
+        sizes = np.bincount(period_idx, minlength=len(self.labels))
+        X = X[order]
+        offset = 0
+        for p, size in enumerate(sizes):
+            if size:
+                block = X[offset:offset + size]
+                self.pairs[p] += np.rint(block.T @ block).astype(np.int64)
+                self.n[p] += size
+            offset += size
+        return self
+
+    def merge(self, other):
+        if other.labels != self.labels or other.distortion_names != self.distortion_names:
+            raise ValueError("Cannot merge co-occurrence counts with different periods or distortions")
+        self.n += other.n
+        self.pairs += other.pairs
+        return self
+
+    def metrics(self, label):
+        """
+        Returns {metric: DataFrame} with co-occurrence counts, phi (Pearson on 0/1 data), lift and PMI for one period.
+        Pairs that never co-occur get NaN PMI; undefined correlations (constant columns) are NaN.
+        """
+        p = self.labels.index(label)
+        n = float(self.n[p])
+        counts = self.pairs[p].astype(np.float64)
+        marginal = np.diag(counts)
+        n1, n2 = marginal[:, None], marginal[None, :]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = (n * counts - n1 * n2) / np.sqrt(n1 * (n - n1) * n2 * (n - n2))
+            lift = n * counts / (n1 * n2)
+            pmi = np.where(counts > 0, np.log(lift), np.nan)
+
+        def frame(values):
+            return pd.DataFrame(values, index=self.distortion_names, columns=self.distortion_names)
+
+        return {
+            'count': frame(self.pairs[p]),
+            'phi': frame(np.where(np.isfinite(phi), phi, np.nan)),
+            'lift': frame(np.where(np.isfinite(lift), lift, np.nan)),
+            'pmi': frame(pmi),
+        }
+
+    def export_tables(self, prefix, output_dir=None):
+        """
+        Writes one CSV per period and metric to the tables directory and returns the written paths.
+        """
+        output_dir = output_dir or Config.TABLES_DIR
+        paths = []
+        for label in self.labels:
+            if not self.n[self.labels.index(label)]:
+                continue
+            for metric, table in self.metrics(label).items():
+                path = os.path.join(output_dir, f'{prefix}_{label}_{metric}.csv')
+                table.to_csv(path)
+                paths.append(path)
+        return paths
@@ -1,47 +1,50 @@
+import os
+import re
 import pandas as pd
 import nltk
 from .config import Config
+from .profiler import instrumented
+
+# Fallback sentence boundary when the NLTK punkt models cannot be found or downloaded (offline runs)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+def _punkt_available():
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('tokenizers/punkt_tab')
+        return True
+    except LookupError:
+        return False
 
 class DataLoader:
     def __init__(self):
         # Ensure NLTK data is available
-        try:
-            nltk.data.find('tokenizers/punkt')
-        except LookupError:
-            nltk.download('punkt')
-            nltk.download('punkt_tab')
+        if not _punkt_available():
+            nltk.download('punkt', quiet=True)
+            nltk.download('punkt_tab', quiet=True)
+        self.sent_tokenize = nltk.sent_tokenize
+        if not _punkt_available():
+            print("Warning: NLTK punkt models unavailable, falling back to a simple regex sentence splitter.")
+            self.sent_tokenize = lambda text: [s for s in SENTENCE_BOUNDARY.split(text.strip()) if s]
 
-    def load_data(self, posts_path=None, comments_path=None, nrows=None):
+    def _prepare(self, frame, source_type):
         """
-        Loads posts and comments, merges them, and returns a DataFrame.
+        Adds the unified text column and the source type to a posts or comments frame.
         """
-        posts = pd.DataFrame()
-        comments = pd.DataFrame()
-
-        if posts_path and os.path.exists(posts_path):
-            print(f"Loading posts from {posts_path}...")
-            posts = pd.read_csv(posts_path, nrows=nrows)
+        if source_type == 'post':
             # Create a unified text column
-            posts[Config.TEXT_COLUMN] = posts['title'].fillna('') + " " + posts['body'].fillna('')
-        
-        if comments_path and os.path.exists(comments_path):
-             print(f"Loading comments from {comments_path}...")
-             comments = pd.read_csv(comments_path, nrows=nrows)
-             # Comments usually just have 'body' or 'comment'
-             if 'body' in comments.columns:
-                 comments[Config.TEXT_COLUMN] = comments['body'].fillna('')
-             elif 'comment' in comments.columns:
-                 comments[Config.TEXT_COLUMN] = comments['comment'].fillna('')
-
+            frame[Config.TEXT_COLUMN] = frame['title'].fillna('') + " " + frame['body'].fillna('')
+        # Comments usually just have 'body' or 'comment'
+        elif 'body' in frame.columns:
+            frame[Config.TEXT_COLUMN] = frame['body'].fillna('')
+        elif 'comment' in frame.columns:
+            frame[Config.TEXT_COLUMN] = frame['comment'].fillna('')
         # Add source type for tracking
-        if not posts.empty:
-            posts['source_type'] = 'post'
-        if not comments.empty:
-            comments['source_type'] = 'comment'
-            
-        # Combine
-        full_df = pd.concat([posts, comments], ignore_index=True)
-        
+        if not frame.empty:
+            frame['source_type'] = source_type
+        return frame
+
+    def _add_dates(self, full_df):
         # Ensure date is datetime
         # Iterate through possible date columns
         date_cols = ['created_utc', 'date', 'timestamp', 'created']
@@ -57,26 +60,78 @@ class DataLoader:
 
         return full_df
 
+    @instrumented('load_data')
+    def load_data(self, posts_path=None, comments_path=None, nrows=None):
+        """
+        Loads posts and comments, merges them, and returns a DataFrame.
+        """
+        posts = pd.DataFrame()
+        comments = pd.DataFrame()
+
+        if posts_path and os.path.exists(posts_path):
+            print(f"Loading posts from {posts_path}...")
+            posts = self._prepare(pd.read_csv(posts_path, nrows=nrows), 'post')
+        
+        if comments_path and os.path.exists(comments_path):
+             print(f"Loading comments from {comments_path}...")
+             comments = self._prepare(pd.read_csv(comments_path, nrows=nrows), 'comment')
+
+        # Combine
+        full_df = pd.concat([posts, comments], ignore_index=True)
+        return self._add_dates(full_df)
+
+    @instrumented('load_shard')
+    def load_shard(self, path, source_type, start=0, nrows=None, offset=0):
+        """
+        Loads rows [start, start + nrows) of one posts or comments file, indexed from offset
+        (the position of the first row in the frame load_data would return).
+        """
+        frame = pd.read_csv(path, skiprows=range(1, start + 1), nrows=nrows)
+        frame.index = pd.RangeIndex(offset, offset + len(frame))
+        return self._add_dates(self._prepare(frame, source_type))
+
+    def iter_chunks(self, posts_path=None, comments_path=None, nrows=None, chunksize=None):
+        """
+        Lazily reads posts then comments in chunks of chunksize rows, each prepared like the rows of
+        load_data (same index, text, source_type and date columns).
+        """
+        offset = 0
+        for path, source_type in [(posts_path, 'post'), (comments_path, 'comment')]:
+            if not (path and os.path.exists(path)):
+                continue
+            print(f"Streaming {source_type}s from {path}...")
+            for chunk in pd.read_csv(path, nrows=nrows, chunksize=chunksize or Config.STREAM_CHUNK_ROWS):
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield self._add_dates(self._prepare(chunk, source_type))
+
+    @instrumented('preprocess_sentences')
     def preprocess_sentences(self, df):
         """
-        Splits text into sentences. Returns a list of (sentence, date, source_id) tuples.
+        Splits text into sentences. Returns a DataFrame of (sentence, date, source_type, original_index[, author]) rows.
         """
         print("Tokenizing sentences...")
+        has_author = Config.AUTHOR_COLUMN in df.columns
         sentences_data = []
         for index, row in df.iterrows():
             text = str(row.get(Config.TEXT_COLUMN, ''))
             date = row.get(Config.DATE_COLUMN, pd.NaT)
+            source_type = row.get('source_type')
             
             if not text.strip():
                 continue
                 
-            raw_sentences = nltk.sent_tokenize(text)
+            raw_sentences = self.sent_tokenize(text)
             for s in raw_sentences:
-                sentences_data.append({
+                sentence = {
                     'sentence': s,
                     'date': date,
+                    'source_type': source_type,
                     'original_index': index
-                })
+                }
+                if has_author:
+                    sentence[Config.AUTHOR_COLUMN] = row[Config.AUTHOR_COLUMN]
+                sentences_data.append(sentence)
                 
         return pd.DataFrame(sentences_data)
 import os 
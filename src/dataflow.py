@@ -0,0 +1,239 @@
+"""
+Pipelined execution: reader -> sentence splitter -> detector -> consumer, each stage in its own thread
+with bounded queues in between, so CSV parsing, splitting, detection and writing overlap. A full queue
+blocks the stage feeding it (backpressure), which bounds the number of chunks in flight.
+"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .config import Config
+from .data_loader import DataLoader
+from .distortion_detector import DistortionDetector
+from .profiler import PROFILER
+
+_DONE = object()
+
+class StageThread(threading.Thread):
+    """
+    Applies func to every item of inbox and puts the non-empty results in outbox. With a process pool,
+    up to `window` items are processed concurrently and results are still emitted in input order.
+    Records busy time and the time spent waiting for input and for room downstream.
+    """
+    def __init__(self, name, func, inbox, outbox, stop, errors, pool=None, window=1):
+        super().__init__(name=f'dataflow-{name}', daemon=True)
+        self.stage = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.errors = errors
+        self.pool = pool
+        self.window = window
+        self.stats = {'items': 0, 'busy_s': 0.0, 'wait_in_s': 0.0, 'wait_out_s': 0.0}
+
+    def _get(self):
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                item = self.inbox.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _DONE
+        self.stats['wait_in_s'] += time.perf_counter() - start
+        return item
+
+    def _put(self, item):
+        if item is not _DONE and len(item) == 0:
+            return
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                self.outbox.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats['wait_out_s'] += time.perf_counter() - start
+
+    def _emit(self, compute):
+        start = time.perf_counter()
+        result = compute()
+        self.stats['busy_s'] += time.perf_counter() - start
+        self.stats['items'] += 1
+        self._put(result)
+
+    def run(self):
+        pending = deque()
+        try:
+            while True:
+                item = self._get()
+                if item is _DONE:
+                    break
+                if self.pool is None:
+                    self._emit(lambda: self.func(item))
+                    continue
+                pending.append(self.pool.submit(self.func, item))
+                if len(pending) >= self.window:
+                    self._emit(pending.popleft().result)
+            while pending and not self.stop.is_set():
+                self._emit(pending.popleft().result)
+        except BaseException as exc:
+            self.errors.append(exc)
+            self.stop.set()
+        finally:
+            for future in pending:
+                future.cancel()
+            if not self.stop.is_set():
+                self._put(_DONE)
+
+def _source(name, items, outbox, stop, errors, stats):
+    try:
+        iterator = iter(items)
+        while not stop.is_set():
+            start = time.perf_counter()
+            item = next(iterator, _DONE)
+            stats['busy_s'] += time.perf_counter() - start
+            if item is _DONE:
+                break
+            stats['items'] += 1
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    outbox.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            stats['wait_out_s'] += time.perf_counter() - start
+    except BaseException as exc:
+        errors.append(exc)
+        stop.set()
+    finally:
+        if not stop.is_set():
+            outbox.put(_DONE)
+
+class Dataflow:
+    """
+    Runs source (an iterable, e.g. chunked CSV reads) through a chain of (name, func) stages.
+    run() is a generator: the caller's thread is the final consumer. Exceptions raised in any stage
+    stop the whole flow and are re-raised to the caller. Stages listed in pooled run func in a process
+    pool of `workers` processes (func must then be picklable).
+    """
+    def __init__(self, stages, workers=0, pooled=(), initializer=None, queue_size=None):
+        self.stages = stages
+        self.workers = workers
+        self.pooled = set(pooled)
+        self.initializer = initializer
+        self.queue_size = queue_size or Config.STREAM_QUEUE_SIZE
+
+    def run(self, source, name='read'):
+        stop, errors = threading.Event(), []
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer) if self.workers and self.pooled else None
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        source_stats = {'items': 0, 'busy_s': 0.0, 'wait_in_s': 0.0, 'wait_out_s': 0.0}
+        threads = [threading.Thread(target=_source, name=f'dataflow-{name}', daemon=True,
+                                    args=(name, source, queues[0], stop, errors, source_stats))]
+        for i, (stage_name, func) in enumerate(self.stages):
+            stage_pool = pool if stage_name in self.pooled else None
+            threads.append(StageThread(stage_name, func, queues[i], queues[i + 1], stop, errors,
+                                       pool=stage_pool, window=self.workers + 1 if stage_pool else 1))
+        for thread in threads:
+            thread.start()
+
+        wait = 0.0
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    wait += time.perf_counter() - start
+                    continue
+                wait += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        PROFILER.record(f'dataflow:{name}', **{key: round(value, 4) for key, value in source_stats.items()})
+        for thread in threads[1:]:
+            PROFILER.record(f'dataflow:{thread.stage}', **{key: round(value, 4) for key, value in thread.stats.items()})
+        PROFILER.record('dataflow:consumer', wait_in_s=round(wait, 4))
+        if errors:
+            raise errors[0]
+
+class BackgroundWriter:
+    """
+    Appends result chunks to a CSV file from a background thread, so the caller can move on
+    (e.g. to plotting) while the tail of the output is still being written. wait() blocks until done.
+    """
+    def __init__(self, path, queue_size=None):
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size or Config.STREAM_QUEUE_SIZE)
+        self.error = None
+        self.rows = 0
+        self.thread = threading.Thread(target=self._write, name='dataflow-writer') # not a daemon: finishes the file before exit
+        self.thread.start()
+
+    def _write(self):
+        first = True
+        while True:
+            frame = self.queue.get()
+            if frame is _DONE:
+                break
+            if self.error is not None:
+                continue
+            try:
+                frame.to_csv(self.path, index=False, mode='w' if first else 'a', header=first)
+                self.rows += len(frame)
+                first = False
+            except Exception as exc:
+                self.error = exc
+
+    def put(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def close(self):
+        """
+        No more chunks; returns immediately, the writer thread drains its queue.
+        """
+        self.queue.put(_DONE)
+
+    def wait(self):
+        start = time.perf_counter()
+        self.thread.join()
+        PROFILER.record('dataflow:writer_wait', wall_s=round(time.perf_counter() - start, 4), rows_out=self.rows)
+        if self.error is not None:
+            raise self.error
+        return self.path
+
+_WORKER = {}
+
+def _init_worker():
+    _WORKER['loader'] = DataLoader()
+    _WORKER['detector'] = DistortionDetector()
+
+def _split(chunk):
+    return _WORKER['loader'].preprocess_sentences(chunk)
+
+def _detect(sentences):
+    return _WORKER['detector'].detect(sentences)[0]
+
+def detection_flow(loader, detector, workers=0):
+    """
+    The splitter -> detector flow fed by DataLoader.iter_chunks. With workers > 0, both stages hand
+    their chunks to a pool of worker processes (each with its own splitter and detector).
+    """
+    if workers:
+        return Dataflow([('split', _split), ('detect', _detect)], workers=workers,
+                        pooled=['split', 'detect'], initializer=_init_worker)
+    return Dataflow([('split', loader.preprocess_sentences), ('detect', lambda sentences: detector.detect(sentences)[0])])
@@ -0,0 +1,167 @@
+import math
+import numpy as np
+import pandas as pd
+from .config import Config
+
+def hash_values(values):
+    """
+    Stable 64-bit hashes of the non-null values (e.g. author names), identical across processes and runs.
+    """
+    values = pd.Series(values).dropna().astype(str)
+    return pd.util.hash_array(values.to_numpy(dtype=object), categorize=False)
+
+def _bit_length(x):
+    """
+    Vectorized int.bit_length() for uint64 arrays.
+    """
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+def precision_for_error(error):
+    """
+    Smallest HyperLogLog precision whose standard error 1.04 / sqrt(2^p) is within `error`.
+    """
+    return int(min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2)))))
+
+class ExactDistinct:
+    """
+    Exact distinct counter over 64-bit hashes. Mergeable and serializable.
+    """
+    TAG = b'E'
+
+    def __init__(self, hashes=None):
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.uint64)) if hashes is not None else np.empty(0, dtype=np.uint64)
+
+    def add_hashes(self, hashes):
+        self.hashes = np.union1d(self.hashes, np.asarray(hashes, dtype=np.uint64))
+        return self
+
+    def merge(self, other):
+        if not isinstance(other, ExactDistinct):
+            raise ValueError("Cannot merge an exact counter with a HyperLogLog sketch")
+        return self.add_hashes(other.hashes)
+
+    def count(self):
+        return len(self.hashes)
+
+    def copy(self):
+        return ExactDistinct(self.hashes)
+
+    def to_bytes(self):
+        return self.TAG + self.hashes.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        sketch.hashes = np.frombuffer(data[1:], dtype=np.uint64).copy()
+        return sketch
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2^precision registers (standard error 1.04 / sqrt(2^precision)).
+    Small sets are kept as exact hashes until they would use as much memory as the registers,
+    which keeps the many sparse per-day sketches cheap and exact.
+    """
+    TAG = b'H'
+
+    def __init__(self, precision=None):
+        self.precision = precision or precision_for_error(Config.DISTINCT_ERROR)
+        self.m = 1 << self.precision
+        self.sparse = np.empty(0, dtype=np.uint64)
+        self.registers = None
+
+    def _add_dense(self, hashes):
+        p = np.uint64(self.precision)
+        idx = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = hashes & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+        rank = (64 - self.precision) - _bit_length(rest).astype(np.int64) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if self.registers is None:
+            self.sparse = np.union1d(self.sparse, hashes)
+            if len(self.sparse) * 8 > self.m:
+                self.registers = np.zeros(self.m, dtype=np.uint8)
+                self._add_dense(self.sparse)
+                self.sparse = np.empty(0, dtype=np.uint64)
+        else:
+            self._add_dense(hashes)
+        return self
+
+    def merge(self, other):
+        if not isinstance(other, HyperLogLog) or other.precision != self.precision:
+            raise ValueError("Can only merge HyperLogLog sketches of the same precision")
+        if other.registers is None:
+            return self.add_hashes(other.sparse)
+        if self.registers is None:
+            self.registers = other.registers.copy()
+            self._add_dense(self.sparse)
+            self.sparse = np.empty(0, dtype=np.uint64)
+        else:
+            np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        if self.registers is None:
+            return len(self.sparse)
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros) # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def copy(self):
+        sketch = HyperLogLog(self.precision)
+        sketch.sparse = self.sparse.copy()
+        sketch.registers = None if self.registers is None else self.registers.copy()
+        return sketch
+
+    def to_bytes(self):
+        if self.registers is None:
+            return self.TAG + bytes([self.precision, 0]) + self.sparse.tobytes()
+        return self.TAG + bytes([self.precision, 1]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(precision=data[1])
+        if data[2]:
+            sketch.registers = np.frombuffer(data[3:], dtype=np.uint8).copy()
+        else:
+            sketch.sparse = np.frombuffer(data[3:], dtype=np.uint64).copy()
+        return sketch
+
+SKETCH_TYPES = {'hll': HyperLogLog, 'exact': ExactDistinct}
+
+def new_sketch(hashes=None, mode=None):
+    """
+    Creates an empty distinct counter of the configured type (Config.DISTINCT_MODE), optionally filled with hashes.
+    """
+    sketch = SKETCH_TYPES[mode or Config.DISTINCT_MODE]()
+    if hashes is not None:
+        sketch.add_hashes(hashes)
+    return sketch
+
+def merge_sketches(sketches):
+    """
+    Merges an iterable of sketches (None entries are skipped) into a new sketch; None if there are none.
+    """
+    merged = None
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        merged = sketch.copy() if merged is None else merged.merge(sketch)
+    return merged
+
+def sketch_from_bytes(data):
+    for sketch_type in SKETCH_TYPES.values():
+        if data[:1] == sketch_type.TAG:
+            return sketch_type.from_bytes(data)
+    raise ValueError("Unknown distinct sketch encoding")
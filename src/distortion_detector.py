@@ -1,5 +1,10 @@
+import numpy as np
 import pandas as pd
 from .targetwords import * 
+from .profiler import instrumented
+
+# Matched (distortion, ngram) pairs of each flagged sentence, collected by detect() for the inverted index
+ENTRIES_COLUMN = 'matched_entries'
 
 # Map variable names to string names for the report
 DISTORTION_MAP = {
@@ -26,28 +31,48 @@ class DistortionDetector:
                 self.distortion_dictionaries[nice_name] = globals()[var_name]
             else:
                 print(f"Warning: {var_name} not found in targetwords.py")
+        self.compile()
+
+    def compile(self):
+        """
+        Precomputes the lexicon as (bit, distortion, ngrams) so repeated scoring does no dictionary work.
+        Bit i of a sentence mask is set when distortion i (in dictionary order) matches.
+        """
+        self.lexicon = [(1 << bit, name, tuple(ngrams))
+                        for bit, (name, ngrams) in enumerate(self.distortion_dictionaries.items())]
+
+    def score(self, text, with_entries=False):
+        """
+        Scores one sentence with the same substring semantics as detect().
+        Returns (mask, entries), entries being the matched (distortion, ngram) pairs when requested.
+        """
+        text_lower = text.lower()
+        mask = 0
+        entries = []
+        for bit, name, ngrams in self.lexicon:
+            if any(ngram in text_lower for ngram in ngrams):
+                mask |= bit
+                if with_entries:
+                    entries.extend((name, ngram) for ngram in ngrams if ngram in text_lower)
+        return mask, entries
+
+    def names_from_mask(self, mask):
+        return [name for bit, name, _ in self.lexicon if mask & bit]
 
+    @instrumented('detect')
     def detect(self, sentences_df):
         """
         Scans sentences for distortions.
-        Adds boolean columns for each distortion type.
+        Adds boolean columns for each distortion type, and an ENTRIES_COLUMN with the matched entries
+        of flagged sentences (None for the others), found in the same pass.
         """
         print("Detecting distortions...")
         
-        # detect(...)
-        print("Detecting distortions...")
-        
-        # Inefficient but simple iteration for now, can be optimized with regex if needed
-        # Given n-grams can be phrases, simple 'in' check is safest
-        
-        def check_distortions(text):
-            hits = {}
-            text_lower = text.lower()
-            for distortion, ngrams in self.distortion_dictionaries.items():
-                hits[distortion] = any(ngram in text_lower for ngram in ngrams)
-            return pd.Series(hits)
-
-        distortions_found = sentences_df['sentence'].apply(check_distortions)
+        # Given n-grams can be phrases, simple 'in' check is safest (see score())
+        scored = [self.score(text, with_entries=True) for text in sentences_df['sentence']]
+        masks = np.fromiter((mask for mask, _ in scored), dtype=np.int64, count=len(scored))
+        distortions_found = pd.DataFrame({name: (masks & bit) != 0 for bit, name, _ in self.lexicon}, index=sentences_df.index)
+        distortions_found[ENTRIES_COLUMN] = [entries or None for _, entries in scored]
         
         # Merge results back
         result_df = pd.concat([sentences_df, distortions_found], axis=1)
@@ -0,0 +1,157 @@
+"""
+Multi-process sentence encoding. With short sentences, torch's intra-op threading keeps few cores busy
+within one process; several encoder processes with a few threads each scale much better.
+
+Sentences are sorted by length and cut into chunks, so every chunk pads to similar lengths, and the
+chunks go through one shared queue (longest first) to the encoder processes. Each process writes its
+embeddings straight into a memory-mapped output matrix; only row indices and sentences are pickled.
+"""
+import os
+import time
+import queue
+import itertools
+import traceback
+import multiprocessing
+import numpy as np
+from threadpoolctl import threadpool_limits
+from .config import Config
+from .profiler import PROFILER
+
+_outputs = itertools.count()
+
+def _limit_threads(threads):
+    # Before torch is imported: its thread pools read these on creation
+    for var in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+        os.environ[var] = str(threads)
+    limits = threadpool_limits(limits=threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass # hashing stand-in encoder
+    return limits
+
+def _encoder_process(model_name, threads, batch_size, inbox, outbox):
+    try:
+        limits = _limit_threads(threads)
+        from .topic_modeler import load_encoder
+        model = load_encoder(model_name)
+        outbox.put(('ready', os.getpid(), model.get_sentence_embedding_dimension()))
+        path, out = None, None
+        while True:
+            task = inbox.get()
+            if task is None:
+                break
+            task_path, rows, sentences = task
+            if task_path != path:
+                del out
+                path, out = task_path, np.load(task_path, mmap_mode='r+')
+            start = time.perf_counter()
+            out[rows] = model.encode(sentences, batch_size=batch_size, show_progress_bar=False)
+            outbox.put(('done', len(rows), time.perf_counter() - start))
+        del out, limits
+    except BaseException:
+        outbox.put(('error', os.getpid(), traceback.format_exc()))
+
+class EncodingPool:
+    """
+    A pool of encoder processes, each loading model_name once and using `threads` torch threads.
+    Use as a context manager (or call close()); encode() can be called any number of times in between.
+    """
+    def __init__(self, model_name=None, processes=None, threads=None, chunk_size=None, batch_size=None):
+        self.model_name = model_name or Config.MODEL_NAME
+        self.processes = processes or Config.ENCODER_PROCESSES
+        self.threads = threads or Config.ENCODER_THREADS or max(1, (os.cpu_count() or 1) // self.processes)
+        self.chunk_size = chunk_size or Config.ENCODER_CHUNK_SIZE
+        self.batch_size = batch_size or Config.ENCODER_BATCH_SIZE
+        self.workers = []
+        self.dimension = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if self.workers:
+            return self
+        # spawn, not fork: forking a parent that already runs torch / BLAS thread pools can deadlock
+        context = multiprocessing.get_context('spawn')
+        self.inbox, self.outbox = context.Queue(), context.Queue()
+        start = time.perf_counter()
+        self.workers = [context.Process(target=_encoder_process, daemon=True, name=f'encoder-{i}',
+                                        args=(self.model_name, self.threads, self.batch_size, self.inbox, self.outbox))
+                        for i in range(self.processes)]
+        for worker in self.workers:
+            worker.start()
+        for _ in self.workers:
+            _, _, self.dimension = self._receive('ready')
+        self.startup_s = time.perf_counter() - start
+        print(f"Started {self.processes} encoder process(es) x {self.threads} thread(s) in {self.startup_s:.1f}s")
+        return self
+
+    def _receive(self, kind):
+        while True:
+            try:
+                message = self.outbox.get(timeout=1)
+            except queue.Empty:
+                dead = [w for w in self.workers if not w.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Encoder process {dead[0].name} exited with code {dead[0].exitcode}")
+                continue
+            if message[0] == 'error':
+                self.close()
+                raise RuntimeError(f"Encoder process {message[1]} failed:\n{message[2]}")
+            if message[0] == kind:
+                return message
+
+    def encode(self, sentences, output_path=None):
+        """
+        Embeddings of sentences (float32, one row per sentence, in input order) as a memory-mapped matrix.
+        With output_path the matrix is kept there as a .npy file; otherwise it lives in a temporary file
+        under Config.SPILL_DIR that is unlinked once mapped.
+        """
+        self.start()
+        sentences = [str(s) for s in sentences]
+        path = output_path or os.path.join(Config.SPILL_DIR, f'embeddings-{os.getpid()}-{next(_outputs)}.npy')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(sentences), self.dimension))
+        del out
+
+        # Longest first: the expensive chunks start early and the short ones fill in at the end
+        order = np.argsort(np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences)), kind='stable')[::-1]
+        start = time.perf_counter()
+        chunks = 0
+        for i in range(0, len(order), self.chunk_size):
+            rows = np.sort(order[i:i + self.chunk_size]) # sequential writes into the output
+            self.inbox.put((path, rows, [sentences[r] for r in rows]))
+            chunks += 1
+        busy = 0.0
+        for _ in range(chunks):
+            _, _, seconds = self._receive('done')
+            busy += seconds
+        wall = time.perf_counter() - start
+
+        PROFILER.record('encoding_pool', rows_in=len(sentences), wall_s=round(wall, 4), busy_s=round(busy, 4),
+                        processes=self.processes, threads=self.threads, chunks=chunks,
+                        sentences_per_s=round(len(sentences) / wall, 1) if wall else None)
+        print(f"Encoded {len(sentences)} sentences in {wall:.1f}s ({len(sentences) / max(wall, 1e-9):.0f}/s)")
+        embeddings = np.load(path, mmap_mode='r+')
+        if output_path is None:
+            os.remove(path) # the mapping stays valid until the array is released
+        return embeddings
+
+    def close(self):
+        if not self.workers:
+            return
+        for worker in self.workers:
+            if worker.is_alive():
+                self.inbox.put(None)
+        for worker in self.workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
@@ -0,0 +1,37 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+def _update(h, obj):
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        h.update(type(obj).__name__.encode())
+        names = [obj.name] if isinstance(obj, pd.Series) else list(obj.columns)
+        h.update(repr(names).encode())
+        h.update(str(obj.dtypes).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(str(obj.dtype).encode() + repr(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'{')
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _update(h, item)
+        h.update(b']')
+    else:
+        h.update(repr(obj).encode())
+    h.update(b'|')
+
+def fingerprint(*objs):
+    """
+    Returns a stable hex digest of the given objects (pandas objects, arrays, containers and scalars).
+    """
+    h = hashlib.sha1()
+    for obj in objs:
+        _update(h, obj)
+    return h.hexdigest()
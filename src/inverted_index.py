@@ -0,0 +1,227 @@
+"""
+Inverted index from lexicon entries and distortions to the sentences that matched them.
+
+Only flagged sentences are indexed. Sentence ids are assigned in date order, so every posting list
+(sorted ids) is also sorted by date, compresses well as varint-encoded deltas and a date range is a
+contiguous id range. On disk (Config.INDEX_DIR):
+
+    terms.json      {term: [offset, n_bytes, n_postings]}, terms being 'entry:<ngram>' and 'distortion:<name>'
+    postings.bin    concatenated varint delta-encoded posting lists
+    sentences.bin   UTF-8 sentences in id order, sliced with offsets.npy
+    dates.npy, source_type.npy, original_index.npy, mask.npy    per-id columns
+
+Queries memory-map the files and only decode the posting lists and sentences they return.
+"""
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from .config import Config
+from .distinct import _bit_length
+from .distortion_detector import ENTRIES_COLUMN
+from .memory import iter_frames, pack_mask
+
+ENTRY_PREFIX = 'entry:'
+DISTORTION_PREFIX = 'distortion:'
+SOURCE_TYPES = ['post', 'comment', 'unknown']
+_NO_DATE = np.iinfo(np.int64).max # undated sentences sort last
+
+def encode_varints(values):
+    """
+    LEB128 varints of a uint64 array (7 bits per byte, high bit set on all but the last byte).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.maximum(1, (_bit_length(values).astype(np.int64) + 6) // 7)
+    starts = np.concatenate([[0], np.cumsum(n_bytes)[:-1]])
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for k in range(int(n_bytes.max()) if len(values) else 0):
+        sel = n_bytes > k
+        byte = (values[sel] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (n_bytes[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+def decode_varints(data):
+    b = np.frombuffer(data, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = ((np.arange(len(b)) - starts[group]) * 7).astype(np.uint64)
+    return np.add.reduceat((b & 0x7f).astype(np.uint64) << shifts, starts)
+
+def encode_postings(ids):
+    ids = np.asarray(ids, dtype=np.uint64)
+    return encode_varints(np.diff(ids, prepend=np.uint64(0)))
+
+def decode_postings(data):
+    return np.cumsum(decode_varints(data)).astype(np.int64)
+
+class IndexBuilder:
+    """
+    Collects the flagged sentences of detection results (DataFrames or partitions) with their matched
+    lexicon entries (the ENTRIES_COLUMN of detect(); rescored only when a frame lacks it), then writes the index.
+    """
+    def __init__(self, detector):
+        self.detector = detector
+        self.frames = []
+        self.terms = {}
+
+    def _term_id(self, term):
+        return self.terms.setdefault(term, len(self.terms))
+
+    def add_frame(self, df, distortion_names):
+        flagged = df[df[distortion_names].any(axis=1)]
+        if flagged.empty:
+            return self
+        if ENTRIES_COLUMN in flagged.columns:
+            # Matched during detection
+            masks, matches = pack_mask(flagged, distortion_names), flagged[ENTRIES_COLUMN]
+        else:
+            scored = [self.detector.score(sentence, with_entries=True) for sentence in flagged['sentence'].astype(str)]
+            masks, matches = [mask for mask, _ in scored], [entries for _, entries in scored]
+        term_ids = []
+        for entries in matches:
+            ids = {self._term_id(DISTORTION_PREFIX + name) for name, _ in entries}
+            ids.update(self._term_id(ENTRY_PREFIX + ngram) for _, ngram in entries)
+            term_ids.append(sorted(ids))
+        dates = pd.to_datetime(flagged[Config.DATE_COLUMN]) if Config.DATE_COLUMN in flagged.columns else pd.Series(pd.NaT, index=flagged.index)
+        sources = flagged['source_type'].astype(object) if 'source_type' in flagged.columns else pd.Series('unknown', index=flagged.index)
+        self.frames.append(pd.DataFrame({
+            'sentence': flagged['sentence'].astype(str).to_numpy(),
+            'date': dates.to_numpy(dtype='datetime64[ns]'),
+            'source_type': sources.fillna('unknown').to_numpy(),
+            'original_index': flagged['original_index'].to_numpy(dtype=np.int64) if 'original_index' in flagged.columns else -1,
+            'mask': np.array(masks, dtype=np.uint32),
+            'terms': term_ids,
+        }))
+        return self
+
+    def add(self, result, distortion_names):
+        for frame in iter_frames(result):
+            self.add_frame(frame, distortion_names)
+        return self
+
+    def write(self, index_dir=None):
+        index_dir = index_dir or Config.INDEX_DIR
+        rows = pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame(
+            {'sentence': [], 'date': pd.Series([], dtype='datetime64[ns]'), 'source_type': [], 'original_index': [],
+             'mask': [], 'terms': []})
+        # Sentence ids in date order (stable, so same-date sentences keep input order)
+        dates = rows['date'].to_numpy(dtype='datetime64[ns]').view(np.int64).copy()
+        dates[np.isnat(rows['date'].to_numpy(dtype='datetime64[ns]'))] = _NO_DATE
+        order = np.argsort(dates, kind='stable')
+        rows = rows.iloc[order].reset_index(drop=True)
+        dates = dates[order]
+
+        tmp_dir = index_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        encoded = [s.encode('utf-8') for s in rows['sentence']]
+        with open(os.path.join(tmp_dir, 'sentences.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), np.concatenate([[0], np.cumsum([len(s) for s in encoded])]).astype(np.int64))
+        np.save(os.path.join(tmp_dir, 'dates.npy'), dates)
+        source_codes = {name: i for i, name in enumerate(SOURCE_TYPES)}
+        np.save(os.path.join(tmp_dir, 'source_type.npy'),
+                np.array([source_codes.get(s, source_codes['unknown']) for s in rows['source_type']], dtype=np.uint8))
+        np.save(os.path.join(tmp_dir, 'original_index.npy'), rows['original_index'].to_numpy(dtype=np.int64))
+        np.save(os.path.join(tmp_dir, 'mask.npy'), rows['mask'].to_numpy(dtype=np.uint32))
+
+        # (term, sentence id) pairs sorted by term then id, one compressed posting list per term
+        lengths = rows['terms'].map(len).to_numpy()
+        pair_terms = np.fromiter((t for terms in rows['terms'] for t in terms), dtype=np.int64, count=int(lengths.sum()))
+        pair_ids = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+        pair_order = np.lexsort((pair_ids, pair_terms))
+        pair_terms, pair_ids = pair_terms[pair_order], pair_ids[pair_order]
+        bounds = np.searchsorted(pair_terms, np.arange(len(self.terms) + 1))
+        names = sorted(self.terms, key=self.terms.get)
+        directory, offset = {}, 0
+        with open(os.path.join(tmp_dir, 'postings.bin'), 'wb') as f:
+            for term_id, term in enumerate(names):
+                data = encode_postings(pair_ids[bounds[term_id]:bounds[term_id + 1]])
+                f.write(data)
+                directory[term] = [offset, len(data), int(bounds[term_id + 1] - bounds[term_id])]
+                offset += len(data)
+        with open(os.path.join(tmp_dir, 'terms.json'), 'w') as f:
+            json.dump({'distortion_names': [name for _, name, _ in self.detector.lexicon], 'terms': directory}, f)
+
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp_dir, index_dir)
+        print(f"Indexed {len(rows)} flagged sentences under {len(directory)} terms in {index_dir}")
+        return index_dir
+
+class InvertedIndex:
+    """
+    Read side: (entry | distortion) x date range queries over a written index.
+    """
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or Config.INDEX_DIR
+        with open(os.path.join(self.index_dir, 'terms.json')) as f:
+            meta = json.load(f)
+        self.distortion_names = meta['distortion_names']
+        self.terms = meta['terms']
+        self.postings = np.memmap(os.path.join(self.index_dir, 'postings.bin'), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(self.index_dir, 'postings.bin')) else np.zeros(0, dtype=np.uint8)
+        self.sentences = np.memmap(os.path.join(self.index_dir, 'sentences.bin'), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(self.index_dir, 'sentences.bin')) else np.zeros(0, dtype=np.uint8)
+        load = lambda name: np.load(os.path.join(self.index_dir, f'{name}.npy'), mmap_mode='r')
+        self.offsets, self.dates = load('offsets'), load('dates')
+        self.source_type, self.original_index, self.mask = load('source_type'), load('original_index'), load('mask')
+
+    def __len__(self):
+        return len(self.dates)
+
+    def entries(self):
+        """
+        The indexed lexicon entries with their number of sentences, most frequent first.
+        """
+        counts = {term[len(ENTRY_PREFIX):]: n for term, (_, _, n) in self.terms.items() if term.startswith(ENTRY_PREFIX)}
+        return pd.Series(counts, dtype=np.int64).sort_values(ascending=False)
+
+    def posting_list(self, term):
+        if term not in self.terms:
+            return np.zeros(0, dtype=np.int64)
+        offset, size, _ = self.terms[term]
+        return decode_postings(self.postings[offset:offset + size].tobytes())
+
+    def ids(self, entry=None, distortion=None, start=None, end=None):
+        """
+        Sentence ids matching the lexicon entry and/or distortion with start <= date < end.
+        """
+        if entry is None and distortion is None:
+            raise ValueError("Query needs an entry or a distortion")
+        lists = []
+        if entry is not None:
+            lists.append(self.posting_list(ENTRY_PREFIX + entry.lower()))
+        if distortion is not None:
+            if distortion not in self.distortion_names:
+                raise ValueError(f"Unknown distortion '{distortion}'")
+            lists.append(self.posting_list(DISTORTION_PREFIX + distortion))
+        ids = lists[0] if len(lists) == 1 else np.intersect1d(*lists, assume_unique=True)
+        if start is not None or end is not None:
+            # Ids are in date order: the date range is one id range
+            lo = np.searchsorted(self.dates, pd.Timestamp(start).value) if start is not None else 0
+            hi = np.searchsorted(self.dates, pd.Timestamp(end).value) if end is not None else np.searchsorted(self.dates, _NO_DATE)
+            ids = ids[np.searchsorted(ids, lo):np.searchsorted(ids, hi)]
+        return ids
+
+    def query(self, entry=None, distortion=None, start=None, end=None, limit=None):
+        """
+        Returns the matching sentences as a DataFrame (date, source_type, original_index, distortions, sentence).
+        """
+        ids = self.ids(entry, distortion, start, end)
+        if limit is not None:
+            ids = ids[:limit]
+        sentences = [bytes(self.sentences[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8') for i in ids]
+        dates = np.asarray(self.dates)[ids]
+        return pd.DataFrame({
+            'date': pd.to_datetime(np.where(dates == _NO_DATE, np.iinfo(np.int64).min, dates)),
+            'source_type': [SOURCE_TYPES[code] for code in np.asarray(self.source_type)[ids]],
+            'original_index': np.asarray(self.original_index)[ids],
+            'distortions': ['; '.join(name for bit, name in enumerate(self.distortion_names) if int(mask) >> bit & 1)
+                            for mask in np.asarray(self.mask)[ids]],
+            'sentence': sentences,
+        })
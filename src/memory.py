@@ -0,0 +1,148 @@
+import os
+import gc
+import shutil
+import pickle
+import numpy as np
+import pandas as pd
+from .config import Config
+from .profiler import PROFILER, current_rss
+
+MASK_COLUMN = 'distortion_mask'
+CATEGORY_COLUMNS = ['source_type', Config.AUTHOR_COLUMN]
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+def pack_mask(df, distortion_names):
+    """
+    Packs the boolean distortion columns into one integer bitmask (bit i = distortion i).
+    """
+    dtype = np.uint16 if len(distortion_names) <= 16 else np.uint32
+    mask = np.zeros(len(df), dtype=dtype)
+    for bit, name in enumerate(distortion_names):
+        mask |= df[name].to_numpy(dtype=bool).astype(dtype) << dtype(bit)
+    return mask
+
+def unpack_mask(df, distortion_names):
+    """
+    Returns df with one boolean column per distortion rebuilt from the packed bitmask.
+    """
+    if MASK_COLUMN not in df.columns:
+        return df
+    mask = df[MASK_COLUMN].to_numpy()
+    columns = {name: (mask >> mask.dtype.type(bit)) & 1 == 1 for bit, name in enumerate(distortion_names)}
+    return pd.concat([df.drop(columns=[MASK_COLUMN]), pd.DataFrame(columns, index=df.index)], axis=1)
+
+def compact_frame(df, distortion_names=None, keep_columns=None):
+    """
+    Downcasts a frame: categoricals for source_type and author, int32 ids and, when distortion_names
+    is given, the boolean distortion columns packed into a single bitmask column.
+    """
+    if keep_columns is not None:
+        df = df[[c for c in keep_columns if c in df.columns]]
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    if 'original_index' in df.columns and len(df) and df['original_index'].max() < np.iinfo(np.int32).max:
+        df['original_index'] = df['original_index'].astype(np.int32)
+    if distortion_names:
+        df[MASK_COLUMN] = pack_mask(df, distortion_names)
+        df = df.drop(columns=list(distortion_names))
+    return df
+
+class PartitionStore:
+    """
+    A frame held as compact partitions. Partitions stay in memory while they fit in their share
+    of the memory budget and are spilled to disk (pickles under Config.SPILL_DIR) when they do not.
+    """
+    def __init__(self, name, budget_bytes, distortion_names=None):
+        self.name = name
+        self.budget_bytes = budget_bytes
+        self.distortion_names = list(distortion_names) if distortion_names else None
+        self.spill_dir = os.path.join(Config.SPILL_DIR, name)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.partitions = [] # DataFrame (in memory) or path (spilled)
+        self.rows = 0
+        self.spilled = 0
+
+    @classmethod
+    def from_files(cls, name, paths, rows, distortion_names=None):
+        """
+        A store over compact partitions already pickled to disk (e.g. by shard workers).
+        """
+        store = cls(name, None, distortion_names)
+        store.partitions = list(paths)
+        store.rows = rows
+        return store
+
+    def __len__(self):
+        return self.rows
+
+    def _in_memory_bytes(self):
+        return sum(frame_bytes(p) for p in self.partitions if isinstance(p, pd.DataFrame))
+
+    def add(self, df):
+        df = compact_frame(df, self.distortion_names)
+        self.partitions.append(df)
+        self.rows += len(df)
+        rss = current_rss() or 0
+        if self._in_memory_bytes() > self.budget_bytes * Config.MEMORY_PARTITION_SHARE or rss > self.budget_bytes:
+            self.spill()
+
+    def exists(self):
+        """
+        False when a spilled partition file is gone (e.g. a cached store whose spill directory was reused).
+        """
+        return all(os.path.exists(p) for p in self.partitions if not isinstance(p, pd.DataFrame))
+
+    def spill(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        for i, partition in enumerate(self.partitions):
+            if isinstance(partition, pd.DataFrame):
+                path = os.path.join(self.spill_dir, f'part-{i:05d}.pkl')
+                with open(path, 'wb') as f:
+                    pickle.dump(partition, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.partitions[i] = path
+                self.spilled += 1
+        gc.collect()
+
+    def iter_frames(self):
+        """
+        Yields the partitions one at a time, with boolean distortion columns restored.
+        """
+        for partition in self.partitions:
+            if not isinstance(partition, pd.DataFrame):
+                with open(partition, 'rb') as f:
+                    partition = pickle.load(f)
+            yield unpack_mask(partition, self.distortion_names) if self.distortion_names else partition
+
+def iter_frames(data):
+    """
+    Iterates a DataFrame (as one frame) or a PartitionStore (partition by partition).
+    """
+    if isinstance(data, PartitionStore):
+        yield from data.iter_frames()
+    else:
+        yield data
+
+class MemoryBudget:
+    """
+    Compares the process RSS after each stage to the budget and records it in the run report.
+    """
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.budget_bytes = int(budget_mb * 2 ** 20)
+
+    def report(self, stage, output=None):
+        rss = current_rss()
+        if rss is None:
+            return
+        rss_mb = round(rss / 2 ** 20, 1)
+        share = rss_mb / self.budget_mb
+        store = output[0] if isinstance(output, tuple) and output else output
+        spilled = store.spilled if isinstance(store, PartitionStore) else None
+        print(f"[memory] {stage}: RSS {rss_mb} MB / budget {self.budget_mb} MB ({share:.0%})"
+              + (f", {spilled} partition(s) spilled" if spilled else ""))
+        PROFILER.record(f'memory:{stage}', rss_mb=rss_mb, budget_mb=self.budget_mb, over_budget=share > 1,
+                        spilled_partitions=spilled)
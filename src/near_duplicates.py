@@ -0,0 +1,154 @@
+"""
+Near-duplicate sentence groups (templated posts, lightly edited reposts, quoted replies) with MinHash and LSH.
+
+Sentences are normalized (lowercase, punctuation and whitespace collapsed) and shingled into character
+k-grams, all hashed at once with a rolling hash over the concatenated bytes. Each MinHash permutation is a
+multiply-shift hash of the shingle hashes, reduced per sentence with np.minimum.reduceat. Signatures are cut
+into bands; sentences sharing a band are candidates, kept as duplicates when their signatures agree on at
+least `threshold` of the permutations (estimated Jaccard similarity), and groups are the connected components.
+"""
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from .config import Config
+
+_ROLL = np.uint64(1099511628211) # FNV prime, rolling hash base
+
+def _mix(x):
+    # splitmix64 finalizer: spreads the rolling hash over all 64 bits
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+def normalize(sentences):
+    return (pd.Series(sentences, dtype=object).astype(str).str.lower()
+            .str.replace(r'[\W_]+', ' ', regex=True).str.strip())
+
+def shingle_hashes(sentences, k):
+    """
+    Hashes of the character k-grams of each normalized sentence, concatenated, with the start of each
+    sentence's run (sentences shorter than k are padded, so every sentence has at least one shingle).
+    """
+    encoded = [s.encode('utf-8').ljust(k) for s in normalize(sentences)]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    n_windows = len(data) - k + 1
+    hashes = np.zeros(n_windows, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for j in range(k):
+            hashes = hashes * _ROLL + data[j:j + n_windows]
+        hashes = _mix(hashes)
+    # Keep the windows that start and end inside one sentence
+    counts = lengths - k + 1
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    starts = np.repeat(offsets - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+    return hashes[starts], np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+def lsh_params(threshold, num_perm, fp_weight=0.2):
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the weighted false positive and false negative
+    probability mass of the banding S-curve 1 - (1 - s^rows)^bands around threshold. Candidates are verified
+    on their full signatures, so a false positive only costs a comparison: misses weigh more.
+    """
+    s = np.linspace(0, 1, 501)
+    best, params = np.inf, (num_perm, 1)
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        p = 1 - (1 - s ** rows) ** bands
+        error = fp_weight * p[s < threshold].sum() + (1 - fp_weight) * (1 - p[s >= threshold]).sum()
+        if error < best:
+            best, params = error, (bands, rows)
+    return params
+
+class NearDuplicates:
+    """
+    Groups sentences whose estimated Jaccard similarity (over character shingles) is at least threshold.
+    """
+    def __init__(self, threshold=None, num_perm=None, shingle_size=None, seed=0):
+        self.threshold = threshold or Config.NEAR_DUP_THRESHOLD
+        self.num_perm = num_perm or Config.NEAR_DUP_PERMUTATIONS
+        self.shingle_size = shingle_size or Config.NEAR_DUP_SHINGLE_SIZE
+        self.bands, self.rows = lsh_params(self.threshold, self.num_perm)
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashes: odd multipliers, top 32 bits of a * x + b
+        self.a = rng.integers(0, 2 ** 63, self.num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, self.num_perm, dtype=np.uint64)
+
+    def signatures(self, sentences, batch_size=None):
+        """
+        MinHash signatures, (n_sentences, num_perm) uint32.
+        """
+        batch_size = batch_size or Config.NEAR_DUP_BATCH
+        signatures = np.empty((len(sentences), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(sentences), batch_size):
+            hashes, starts = shingle_hashes(sentences[start:start + batch_size], self.shingle_size)
+            with np.errstate(over='ignore'):
+                for i in range(self.num_perm):
+                    permuted = ((self.a[i] * hashes + self.b[i]) >> np.uint64(32)).astype(np.uint32)
+                    signatures[start:start + len(starts), i] = np.minimum.reduceat(permuted, starts)
+        return signatures
+
+    def _candidates(self, signatures):
+        """
+        (u, v) pairs sharing at least one band. Buckets of up to Config.NEAR_DUP_MAX_BUCKET sentences yield all
+        their pairs; in larger ones (mostly copies of one template) every member is paired with the bucket's first
+        member and with the member before it, so candidate pairs stay linear in the bucket size.
+        """
+        max_bucket = Config.NEAR_DUP_MAX_BUCKET
+        pairs = []
+        for band in range(self.bands):
+            key = np.zeros(len(signatures), dtype=np.uint64)
+            with np.errstate(over='ignore'):
+                for col in range(band * self.rows, (band + 1) * self.rows):
+                    key = (key ^ signatures[:, col]) * _ROLL
+            order = np.argsort(key, kind='stable')
+            sorted_keys = key[order]
+            starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+            sizes = np.diff(np.append(starts, len(order)))
+            for size in np.unique(sizes[(sizes > 1) & (sizes <= max_bucket)]):
+                i, j = np.triu_indices(size, 1)
+                bucket_starts = starts[sizes == size][:, None]
+                pairs.append(np.column_stack([order[(bucket_starts + i).ravel()], order[(bucket_starts + j).ravel()]]))
+            for start, size in zip(starts[sizes > max_bucket], sizes[sizes > max_bucket]):
+                members = order[start:start + size]
+                pairs.append(np.column_stack([np.full(size - 1, members[0]), members[1:]]))
+                pairs.append(np.column_stack([members[:-1], members[1:]]))
+        pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+        return np.unique(pairs, axis=0)
+
+    def groups(self, sentences):
+        """
+        For every sentence, the index of its group's representative (the group's first sentence).
+        """
+        sentences = list(sentences)
+        n = len(sentences)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Sentences with identical signatures (e.g. exact copies) share a group anyway: LSH runs over distinct ones
+        signatures, distinct = np.unique(self.signatures(sentences), axis=0, return_inverse=True)
+        distinct = distinct.ravel()
+        pairs = self._candidates(signatures)
+        similar = np.zeros(len(pairs), dtype=bool)
+        for start in range(0, len(pairs), 100000):
+            u, v = pairs[start:start + 100000].T
+            similar[start:start + 100000] = (signatures[u] == signatures[v]).mean(axis=1) >= self.threshold
+        pairs = pairs[similar]
+        m = len(signatures)
+        graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(m, m))
+        _, labels = connected_components(graph, directed=False)
+        labels = labels[distinct]
+        representative = np.full(labels.max() + 1, n, dtype=np.int64)
+        np.minimum.at(representative, labels, np.arange(n))
+        return representative[labels]
+
+    def collapse(self, sentences):
+        """
+        Returns (representatives, weights, group): the representative indices in input order, the size
+        of each representative's group, and every sentence's group number (its position in representatives).
+        """
+        representative = self.groups(sentences)
+        representatives, group, weights = np.unique(representative, return_inverse=True, return_counts=True)
+        print(f"Collapsed {len(representative)} sentences into {len(representatives)} near-duplicate groups "
+              f"(Jaccard >= {self.threshold}, {self.bands} bands x {self.rows} rows)")
+        return representatives, weights, group
@@ -0,0 +1,178 @@
+import os
+import glob
+import pickle
+import time
+from .config import Config
+from .fingerprint import fingerprint
+from .profiler import PROFILER, count_rows
+
+# Bump to invalidate every cached stage output (e.g. after changing a stage's output format)
+CACHE_VERSION = 1
+
+def file_stat(path):
+    """
+    Cheap fingerprint input for a file: path, size and modification time (None if missing).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+class Stage:
+    """
+    One pipeline step. func receives the outputs of deps (in order) and returns this stage's output.
+    The cache key covers the deps' keys, the listed Config attributes and params (a dict or a callable returning one).
+    valid(output) can reject a cached output, e.g. when the files it points to were deleted.
+    """
+    def __init__(self, name, func, deps=(), config_keys=(), params=None, valid=None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.config_keys = list(config_keys)
+        self.params = params
+        self.valid = valid
+
+class Pipeline:
+    def __init__(self, stages, cache_dir=None, hooks=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir or Config.CACHE_DIR
+        self.order = self._topological_order()
+        self.keys = {}
+        # Called as hook(stage_name, output) after each stage has run
+        self.hooks = list(hooks or [])
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def ancestors(self, names):
+        found = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in found:
+                found.add(name)
+                pending.extend(self.stages[name].deps)
+        return found
+
+    def descendants(self, name):
+        found = {name}
+        for stage_name in self.order:
+            if any(dep in found for dep in self.stages[stage_name].deps):
+                found.add(stage_name)
+        return found
+
+    def _compute_keys(self):
+        for name in self.order:
+            stage = self.stages[name]
+            params = stage.params() if callable(stage.params) else stage.params
+            self.keys[name] = fingerprint(
+                CACHE_VERSION,
+                name,
+                [self.keys[dep] for dep in stage.deps],
+                {key: getattr(Config, key) for key in stage.config_keys},
+                params,
+            )
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}-{self.keys[name][:16]}.pkl')
+
+    def _load(self, name):
+        path = self._cache_path(name)
+        if not os.path.exists(path):
+            return False, None
+        with open(path, 'rb') as f:
+            output = pickle.load(f)
+        valid = self.stages[name].valid
+        if valid is not None and not valid(output):
+            return False, None
+        return True, output
+
+    def _save(self, name, output):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        # Only keep the latest output of each stage
+        for old in glob.glob(os.path.join(self.cache_dir, f'{name}-*.pkl')):
+            if old != path:
+                os.remove(old)
+
+    def run(self, targets=None, resume=False, from_stage=None, only_stage=None):
+        """
+        Runs the stages needed for targets (default: all) and returns {stage: output} for those computed or loaded.
+        - resume: reuse cached outputs of stages whose key is unchanged.
+        - from_stage: rerun this stage and everything downstream of it, upstream comes from the cache.
+        - only_stage: rerun just this stage, its inputs come from the cache.
+        Upstream outputs missing from the cache are always recomputed.
+        Intermediate outputs are released as soon as every stage that needs them has run.
+        """
+        self._compute_keys()
+        if only_stage:
+            targets, forced = [only_stage], {only_stage}
+        elif from_stage:
+            forced = self.descendants(from_stage)
+            targets = [name for name in (targets or self.order) if name in forced] or [from_stage]
+        else:
+            targets = targets or self.order
+            forced = set() if resume else set(self.order)
+
+        outputs = {}
+        needed = self.ancestors(targets)
+        consumers = {name: sum(name in self.stages[other].deps for other in needed) for name in needed}
+
+        def release(stage):
+            for dep in stage.deps:
+                consumers[dep] -= 1
+                if consumers[dep] <= 0 and dep not in targets:
+                    outputs.pop(dep, None)
+
+        def get(name):
+            if name in outputs:
+                return outputs[name]
+            stage = self.stages[name]
+            if name not in forced:
+                hit, output = self._load(name)
+                if hit:
+                    print(f"[pipeline] {name}: unchanged, using cached output")
+                    PROFILER.record(f'stage:{name}', cached=True, rows_out=count_rows(output))
+                    outputs[name] = output
+                    release(stage)
+                    return output
+            inputs = [get(dep) for dep in stage.deps]
+            print(f"[pipeline] {name}: running")
+            start = time.perf_counter()
+            with PROFILER.section(f'stage:{name}', rows_in=count_rows(inputs[0]) if inputs else None, cprofile=True) as record:
+                output = stage.func(*inputs)
+                record['rows_out'] = count_rows(output)
+            print(f"[pipeline] {name}: done in {time.perf_counter() - start:.1f}s")
+            self._save(name, output)
+            outputs[name] = output
+            del inputs
+            release(stage)
+            for hook in self.hooks:
+                hook(name, output)
+            return output
+
+        for name in targets:
+            get(name)
+        return outputs
@@ -0,0 +1,154 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+import os
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from .config import Config
+from .fingerprint import fingerprint
+from .profiler import instrumented
+
+# Bump when the drawing code changes so existing figures are re-rendered
+RENDER_VERSION = 1
+
+# Figures kept alive per process and cleared between jobs, keyed by figsize
+_FIGURES = {}
+
+def _init_worker():
+    matplotlib.use('Agg')
+    plt.style.use(Config.PLOT_STYLE)
+
+def _get_figure(figsize):
+    fig = _FIGURES.get(figsize)
+    if fig is None:
+        fig = plt.figure(figsize=figsize)
+        _FIGURES[figsize] = fig
+    else:
+        fig.clf()
+    return fig
+
+def _draw_series(ax, series, data_type, color):
+    if data_type == 'spikes':
+        ax.bar(series.index, series, color=color, width=5)
+    else:
+        ax.plot(series.index, series, color=color)
+
+def _render_series(job):
+    fig = _get_figure((10, 6))
+    ax = fig.add_subplot(1, 1, 1)
+    _draw_series(ax, job['series'], job['data_type'], job['color'])
+    ax.set_title(job['title'])
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Value')
+    fig.tight_layout()
+    fig.savefig(job['path'])
+
+def _render_summary(job):
+    names = list(job['series'].keys())
+    cols = 4
+    rows = math.ceil(len(names) / cols)
+    fig = _get_figure((20, 15))
+    axes = fig.subplots(rows, cols).flatten()
+    for i, distortion in enumerate(names):
+        ax = axes[i]
+        _draw_series(ax, job['series'][distortion], job['data_type'], job['color'])
+        ax.set_title(distortion)
+        ax.tick_params(axis='x', rotation=45)
+
+    # Hide empty subplots in summary
+    for i in range(len(names), len(axes)):
+        axes[i].axis('off')
+
+    fig.suptitle(job['title'], fontsize=16)
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.savefig(job['path'])
+
+def _render_heatmap(job):
+    fig = _get_figure((10, 8))
+    ax = fig.add_subplot(1, 1, 1)
+    sns.heatmap(job['matrix'], annot=True, cmap='coolwarm', fmt=".2f", ax=ax, **job.get('heatmap_kws', {}))
+    ax.set_title(job['title'])
+    fig.tight_layout()
+    fig.savefig(job['path'])
+
+def _render_combined(job):
+    fig = _get_figure((16, 8))
+    ax = fig.add_subplot(1, 1, 1)
+    for distortion, smoothed in job['series'].items():
+        ax.plot(smoothed.index, smoothed, label=distortion, alpha=0.7)
+    for label, x in job.get('markers', []):
+        ax.axvline(x=x, color='red', linestyle='--', label=label)
+    ax.set_title(job['title'])
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    fig.tight_layout()
+    fig.savefig(job['path'])
+
+RENDERERS = {
+    'series': _render_series,
+    'summary': _render_summary,
+    'heatmap': _render_heatmap,
+    'combined': _render_combined,
+}
+
+# Rough relative cost, used to start the expensive figures first
+JOB_COST = {'summary': 12, 'combined': 4, 'heatmap': 2, 'series': 1}
+
+def render_job(job):
+    RENDERERS[job['kind']](job)
+    return job['path']
+
+def job_fingerprint(job):
+    return fingerprint(RENDER_VERSION, Config.PLOT_STYLE, job)
+
+class PlotRenderer:
+    def __init__(self, workers=None, manifest_path=None, force=False):
+        self.workers = workers or Config.PLOT_WORKERS or os.cpu_count() or 1
+        self.manifest_path = manifest_path or Config.RENDER_MANIFEST_PATH
+        self.force = force
+
+    def _load_manifest(self):
+        if self.force or not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    @instrumented('render_plots')
+    def render(self, jobs):
+        """
+        Renders a list of independent plot jobs, in a process pool when more than one worker is available.
+        Each job is a dict with a 'kind' (see RENDERERS), an output 'path' and the data to draw.
+        Jobs whose fingerprint matches the render manifest and whose file exists are skipped.
+        """
+        if not jobs:
+            return []
+        manifest = self._load_manifest()
+        fingerprints = {job['path']: job_fingerprint(job) for job in jobs}
+        pending = [job for job in jobs
+                   if manifest.get(job['path']) != fingerprints[job['path']] or not os.path.exists(job['path'])]
+        skipped = len(jobs) - len(pending)
+
+        pending.sort(key=lambda j: JOB_COST.get(j['kind'], 1), reverse=True)
+        workers = min(self.workers, len(pending))
+
+        if workers <= 1:
+            _init_worker()
+            rendered = [render_job(job) for job in pending]
+        else:
+            print(f"Rendering {len(pending)} plots with {workers} processes...")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                rendered = list(pool.map(render_job, pending, chunksize=max(1, len(pending) // (workers * 4))))
+
+        for path in rendered:
+            manifest[path] = fingerprints[path]
+        self._save_manifest(manifest)
+        print(f"Plots rendered: {len(rendered)}, skipped (unchanged): {skipped}")
+        return rendered
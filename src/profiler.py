@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+def _mb(n_bytes):
+    return round(n_bytes / 2 ** 20, 2)
+
+def current_rss():
+    """
+    Current resident set size in bytes (Linux /proc), or None if unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss():
+    """
+    Peak resident set size of the process so far in bytes, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def count_rows(obj):
+    """
+    Row count of a stage/method input or output: DataFrames, arrays, lists and dicts by length, tuples by their first item.
+    """
+    if isinstance(obj, tuple):
+        return count_rows(obj[0]) if obj else None
+    if hasattr(obj, '__len__') and not isinstance(obj, (str, bytes)):
+        return len(obj)
+    return None
+
+class Profiler:
+    """
+    Records wall/CPU time, rows in/out, throughput and memory of named sections, and writes them as a JSON run report.
+    Traced (tracemalloc) peaks and per-stage cProfile dumps are only collected when enabled, as they slow the run down.
+    """
+    def __init__(self):
+        self.records = []
+        self.trace_memory = False
+        self.cprofile_dir = None
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def configure(self, trace_memory=False, cprofile_dir=None):
+        self.trace_memory = trace_memory
+        self.cprofile_dir = cprofile_dir
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def section(self, name, rows_in=None, cprofile=False):
+        """
+        Times the enclosed block. The yielded record can be updated (e.g. record['rows_out'] = n).
+        """
+        stack = self._stack()
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None, 'thread': threading.current_thread().name,
+                  'rows_in': rows_in, 'rows_out': None}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            traced_start, peak_so_far = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['_traced_peak'] = max(stack[-1].get('_traced_peak', 0), peak_so_far)
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile() if cprofile and self.cprofile_dir else None
+        rss_start = current_rss()
+        stack.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+                path = os.path.join(self.cprofile_dir, f'{name.replace(":", "_").replace(" ", "_")}.prof')
+                profile.dump_stats(path)
+                record['cprofile'] = path
+            wall = time.perf_counter() - wall_start
+            stack.pop()
+            record['wall_s'] = round(wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu_start, 4)
+            rows = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+            record['rows_per_s'] = round(rows / wall, 1) if rows is not None and wall > 0 else None
+            rss_end = current_rss()
+            record['rss_start_mb'] = _mb(rss_start) if rss_start is not None else None
+            record['rss_end_mb'] = _mb(rss_end) if rss_end is not None else None
+            # The section's own memory: the process-wide peak below only ever grows from one section to the next
+            record['rss_delta_mb'] = _mb(rss_end - rss_start) if rss_start is not None and rss_end is not None else None
+            peak = peak_rss()
+            record['process_peak_rss_mb'] = _mb(peak) if peak is not None else None
+            if tracing:
+                traced_end, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, record.pop('_traced_peak', 0))
+                record['traced_peak_mb'] = _mb(peak)
+                record['traced_delta_mb'] = _mb(traced_end - traced_start)
+                if stack:
+                    stack[-1]['_traced_peak'] = max(stack[-1].get('_traced_peak', 0), peak)
+            with self._lock:
+                self.records.append(record)
+
+    def record(self, name, **fields):
+        """
+        Adds an untimed entry, e.g. for a stage whose output was taken from the cache.
+        """
+        with self._lock:
+            self.records.append({'name': name, **fields})
+
+    def report(self):
+        peak = peak_rss()
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'total_wall_s': round(time.time() - self.started, 3),
+            'peak_rss_mb': _mb(peak) if peak is not None else None,
+            'trace_memory': self.trace_memory,
+            'sections': self.records,
+        }
+
+    def write_report(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+
+# Process-wide profiler used by the instrumented methods and the pipeline runner
+PROFILER = Profiler()
+
+def instrumented(name):
+    """
+    Decorator recording a method call as a profiler section. Rows in are counted from the first
+    argument after self, rows out from the return value.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            rows_in = count_rows(args[0]) if args else None
+            with PROFILER.section(name, rows_in=rows_in) as record:
+                result = func(self, *args, **kwargs)
+                record['rows_out'] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
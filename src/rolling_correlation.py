@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+def rolling_correlation(frame, window):
+    """
+    Correlation matrix of every trailing window of `window` rows of a (weeks x distortions) frame.
+    Uses cumulative sums, sums of squares and cross-products, so the cost is O(weeks x pairs).
+    Returns (corr, end_index): corr has shape (n_windows, d, d), end_index labels each window by its last row.
+    """
+    X = frame.to_numpy(dtype=np.float64)
+    X = np.nan_to_num(X - np.nanmean(X, axis=0)) # centering keeps the differences of large sums accurate
+    n_rows, d = X.shape
+    if n_rows < window:
+        return np.empty((0, d, d), dtype=np.float32), frame.index[:0]
+
+    zeros = np.zeros((1, d))
+    s1 = np.concatenate([zeros, np.cumsum(X, axis=0)])
+    s2 = np.concatenate([zeros[:, :, None] * zeros[:, None, :], np.cumsum(X[:, :, None] * X[:, None, :], axis=0)])
+
+    sums = s1[window:] - s1[:-window]
+    cross = s2[window:] - s2[:-window]
+    cov = cross - sums[:, :, None] * sums[:, None, :] / window
+    var = np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.sqrt(var[:, :, None] * var[:, None, :])
+    corr = np.where(np.isfinite(corr), np.clip(corr, -1, 1), np.nan)
+    return corr.astype(np.float32), frame.index[window - 1:]
+
+def top_pairs(corr, names, n=6):
+    """
+    The n distortion pairs with the largest mean absolute rolling correlation.
+    """
+    finite = np.isfinite(corr)
+    mean_abs = np.where(finite, np.abs(corr), 0).sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+    i, j = np.triu_indices(len(names), k=1)
+    order = np.argsort(-np.nan_to_num(mean_abs[i, j]), kind='stable')[:n]
+    return [(names[i[k]], names[j[k]]) for k in order]
+
+def pair_series(corr, end_index, names, pairs):
+    """
+    {'A / B': Series} of the rolling correlation of each selected pair.
+    """
+    pos = {name: k for k, name in enumerate(names)}
+    return {f'{a} / {b}': pd.Series(corr[:, pos[a], pos[b]], index=end_index) for a, b in pairs}
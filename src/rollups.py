@@ -0,0 +1,169 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from .config import Config
+from .cooccurrence import period_ranges, default_period_labels
+from .distinct import new_sketch, merge_sketches, sketch_from_bytes, hash_values
+
+ROWS_COLUMN = '_rows'
+
+class RollupStore:
+    """
+    Daily per-distortion counts and distinct-poster sketches (HyperLogLog or exact, see Config.DISTINCT_MODE),
+    keyed by (day, source_type).
+    Coarser views (week, month, custom periods) are derived by merging the daily partials,
+    so changing granularity never requires rescanning sentences.
+    """
+    def __init__(self, distortion_names):
+        self.distortion_names = list(distortion_names)
+        self.counts = pd.DataFrame(columns=self.distortion_names + [ROWS_COLUMN], dtype=np.int64,
+                                   index=pd.MultiIndex.from_arrays([pd.DatetimeIndex([]), []], names=['day', 'source_type']))
+        self.sketches = {}
+        self.has_authors = False
+
+    @classmethod
+    def from_frame(cls, df, distortion_names):
+        return cls(distortion_names).add_frame(df)
+
+    def add_frame(self, df):
+        """
+        Adds sentence-level detection results (date, optional source_type/author, boolean distortion columns).
+        """
+        df = df.dropna(subset=[Config.DATE_COLUMN])
+        if df.empty:
+            return self
+        day = pd.to_datetime(df[Config.DATE_COLUMN]).dt.floor('D').rename('day')
+        if 'source_type' in df.columns:
+            source = df['source_type'].astype(object).fillna('unknown').rename('source_type')
+        else:
+            source = pd.Series('all', index=df.index, name='source_type')
+
+        counts = df[self.distortion_names].astype(np.int64).groupby([day, source]).sum()
+        counts[ROWS_COLUMN] = day.groupby([day, source]).size()
+        self._add_counts(counts)
+
+        if Config.AUTHOR_COLUMN in df.columns and df[Config.AUTHOR_COLUMN].notna().any():
+            self.has_authors = True
+            keys = pd.DataFrame({'day': day, 'source_type': source, 'author': df[Config.AUTHOR_COLUMN]}).dropna()
+            keys['hash'] = hash_values(keys['author'])
+            for key, hashes in keys.groupby(['day', 'source_type'])['hash']:
+                self._add_sketch(key, new_sketch(hashes.to_numpy(dtype=np.uint64)))
+        return self
+
+    def _add_counts(self, counts):
+        if self.counts.empty:
+            self.counts = counts.astype(np.int64)
+        else:
+            self.counts = self.counts.add(counts, fill_value=0).astype(np.int64)
+
+    def _add_sketch(self, key, sketch):
+        if key in self.sketches:
+            self.sketches[key].merge(sketch)
+        else:
+            self.sketches[key] = sketch.copy() # merging into it later must not change the source store
+
+    def merge(self, other):
+        """
+        Merges another store (e.g. from another chunk, shard or run) into this one.
+        """
+        if other.distortion_names != self.distortion_names:
+            raise ValueError("Cannot merge rollups with different distortions")
+        self._add_counts(other.counts)
+        for key, sketch in other.sketches.items():
+            self._add_sketch(key, sketch)
+        self.has_authors = self.has_authors or other.has_authors
+        return self
+
+    def subset(self, start=None, end=None):
+        """
+        A new store with the days start <= day < end.
+        """
+        days = self.counts.index.get_level_values('day')
+        keep = np.ones(len(days), dtype=bool)
+        if start is not None:
+            keep &= days >= pd.Timestamp(start)
+        if end is not None:
+            keep &= days < pd.Timestamp(end)
+        store = RollupStore(self.distortion_names)
+        store.counts = self.counts[keep]
+        store.sketches = {key: sketch.copy() for key, sketch in self.sketches.items()
+                          if (start is None or key[0] >= pd.Timestamp(start)) and (end is None or key[0] < pd.Timestamp(end))}
+        store.has_authors = self.has_authors
+        return store
+
+    def days(self):
+        return self.counts.index.get_level_values('day').unique().sort_values()
+
+    def _daily(self, source_type=None):
+        counts = self.counts
+        if source_type is not None:
+            counts = counts[counts.index.get_level_values('source_type') == source_type]
+        return counts.groupby(level='day').sum().sort_index()
+
+    def _daily_sketches(self, days, source_type=None):
+        by_day = {}
+        for (day, source), sketch in self.sketches.items():
+            if source_type is None or source == source_type:
+                by_day.setdefault(day, []).append(sketch)
+        return [merge_sketches(by_day.get(day, [])) for day in days]
+
+    def view(self, resolution='W', source_type=None, labels=None):
+        """
+        Returns (counts, posters): per-period distortion counts and distinct posters.
+        resolution is a pandas offset alias ('D', 'W', 'MS', ...) or a list of period boundary dates
+        (with optional labels, one more than the boundaries).
+        Without author information, posters falls back to the number of sentences per period.
+        """
+        daily = self._daily(source_type)
+        if isinstance(resolution, str):
+            positions = pd.Series(np.arange(len(daily)), index=daily.index).resample(resolution).agg(['min', 'max'])
+            counts = daily.resample(resolution).sum()
+        else:
+            periods = period_ranges(list(resolution), labels or default_period_labels(list(resolution)))
+            bounds = pd.to_datetime([start for start, _ in periods.values() if start is not None])
+            period_idx = np.searchsorted(bounds, daily.index, side='right')
+            labels = pd.Index(list(periods.keys()), name='period')
+            counts = daily.groupby(period_idx).sum().reindex(range(len(labels)), fill_value=0)
+            counts.index = labels
+            edges = np.searchsorted(period_idx, np.arange(len(labels) + 1))
+            positions = pd.DataFrame({'min': edges[:-1], 'max': edges[1:] - 1}, index=labels)
+            positions = positions.where(positions['max'] >= positions['min'])
+
+        if not self.has_authors:
+            return counts[self.distortion_names], counts[ROWS_COLUMN]
+
+        sketches = self._daily_sketches(daily.index, source_type)
+        posters = []
+        for lo, hi in zip(positions['min'], positions['max']):
+            merged = None if pd.isna(lo) else merge_sketches(sketches[int(lo):int(hi) + 1])
+            posters.append(merged.count() if merged is not None else 0)
+        return counts[self.distortion_names], pd.Series(posters, index=counts.index, dtype=np.int64)
+
+    def to_state(self):
+        return {
+            'distortion_names': self.distortion_names,
+            'counts': self.counts,
+            'sketches': {key: sketch.to_bytes() for key, sketch in self.sketches.items()},
+            'has_authors': self.has_authors,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        store = cls(state['distortion_names'])
+        store.counts = state['counts']
+        store.sketches = {key: sketch_from_bytes(data) for key, data in state['sketches'].items()}
+        store.has_authors = state['has_authors']
+        return store
+
+    def save(self, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.ROLLUPS_FILENAME)
+        with open(path, 'wb') as f:
+            pickle.dump(self.to_state(), f)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.ROLLUPS_FILENAME)
+        with open(path, 'rb') as f:
+            return cls.from_state(pickle.load(f))
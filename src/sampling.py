@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from .config import Config
+
+KEY_COLUMN = '_sample_key'
+STRATUM_COLUMN = '_stratum'
+
+def water_level(counts, budget):
+    """
+    Largest integer level L with sum(min(n, L)) <= budget: strata smaller than L are taken whole,
+    the others contribute L rows each (equal allocation, with the share of small strata redistributed).
+    """
+    counts = np.asarray(counts)
+    if counts.sum() <= budget:
+        return int(counts.max()) if len(counts) else 0
+    lo, hi = 0, int(counts.max())
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if np.minimum(counts, mid).sum() <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class StratifiedSampler:
+    """
+    Single-pass sample of `budget` rows spread evenly over (week, source_type) strata.
+
+    Every row gets a uniform random key and each stratum keeps the rows with the smallest keys, which is
+    a uniform sample without replacement of that stratum (reservoir sampling with random keys). The
+    number of rows per stratum is set by water-filling over the rows seen so far; as that level can only
+    decrease while rows arrive, rows above it are dropped after every chunk and memory stays around budget.
+    """
+    def __init__(self, budget, seed=0):
+        self.budget = budget
+        self.rng = np.random.default_rng(seed)
+        self.strata = {} # (week, source_type) -> code
+        self.seen = np.zeros(0, dtype=np.int64) # rows seen per stratum code
+        self.kept = None
+
+    def _codes(self, chunk):
+        dates = chunk[Config.DATE_COLUMN] if Config.DATE_COLUMN in chunk.columns else pd.Series(pd.NaT, index=chunk.index)
+        # Week start as int64 nanoseconds, undated rows share one stratum (NaT)
+        weeks = pd.to_datetime(dates).dt.to_period('W').dt.start_time.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        sources = chunk['source_type'] if 'source_type' in chunk.columns else pd.Series('all', index=chunk.index)
+        pairs = pd.MultiIndex.from_arrays([weeks, sources.astype(object).fillna('unknown')])
+        local, uniques = pd.factorize(pairs)
+        mapping = np.array([self.strata.setdefault(key, len(self.strata)) for key in uniques], dtype=np.int64)
+        return mapping[local]
+
+    def _prune(self, level):
+        kept = self.kept.sort_values(KEY_COLUMN, kind='stable')
+        rank = kept.groupby(STRATUM_COLUMN, sort=False).cumcount().to_numpy()
+        self.kept = kept[rank < level]
+
+    def add(self, chunk):
+        if chunk.empty:
+            return self
+        codes = self._codes(chunk)
+        chunk = chunk.assign(**{KEY_COLUMN: self.rng.random(len(chunk)), STRATUM_COLUMN: codes})
+        self.seen = np.pad(self.seen, (0, len(self.strata) - len(self.seen)))
+        self.seen += np.bincount(codes, minlength=len(self.strata))
+        self.kept = chunk if self.kept is None else pd.concat([self.kept, chunk])
+        # One row above the level is kept for the final remainder allocation
+        self._prune(water_level(self.seen, self.budget) + 1)
+        return self
+
+    def result(self):
+        """
+        The sampled rows in input order, with the index they have in the full input.
+        """
+        if self.kept is None:
+            return pd.DataFrame()
+        level = water_level(self.seen, self.budget)
+        self._prune(level + 1)
+        rank = self.kept.groupby(STRATUM_COLUMN, sort=False).cumcount().to_numpy()
+        keep = rank < level
+        # Budget left after the level: one more row for the strata whose next key is smallest
+        remainder = self.budget - int(np.minimum(self.seen, level).sum())
+        if remainder > 0:
+            candidates = np.flatnonzero(rank == level)
+            candidates = candidates[np.argsort(self.kept[KEY_COLUMN].to_numpy()[candidates], kind='stable')][:remainder]
+            keep[candidates] = True
+        sample = self.kept[keep].sort_index().drop(columns=[KEY_COLUMN, STRATUM_COLUMN])
+        print(f"Sampled {len(sample)} of {int(self.seen.sum())} rows across {len(self.strata)} "
+              f"(week, source_type) strata, up to {level + (remainder > 0)} per stratum")
+        return sample
+
+    def sample(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+        return self.result()
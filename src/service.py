@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from .config import Config
+from .data_loader import DataLoader
+from .distortion_detector import DistortionDetector
+
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies and batch sizes and reports p50/p99.
+    """
+    def __init__(self, maxlen=10000):
+        self.latencies = deque(maxlen=maxlen)
+        self.batch_sizes = deque(maxlen=maxlen)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batch_sizes.append(size)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batches = np.array(self.batch_sizes)
+            requests = self.requests
+        return {
+            'requests': requests,
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+            'mean_batch_size': round(float(batches.mean()), 2) if len(batches) else None,
+            'batches': len(batches),
+        }
+
+class MicroBatcher:
+    """
+    Collects concurrently submitted requests into one batch, flushed when it reaches max_batch texts
+    or when the oldest request has waited max_wait_ms (the latency budget).
+    """
+    def __init__(self, score_fn, max_batch=None, max_wait_ms=None, tracker=None):
+        self.score_fn = score_fn
+        self.max_batch = max_batch or Config.SERVICE_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else Config.SERVICE_MAX_WAIT_MS) / 1000
+        self.tracker = tracker or LatencyTracker()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, texts, options=None):
+        """
+        Queues a request (list of texts) and returns a Future resolving to one result per text.
+        """
+        future = Future()
+        self.queue.put((list(texts), options or {}, future, time.perf_counter()))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            size = len(batch[0][0])
+            deadline = batch[0][3] + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        texts = [text for item in batch for text in item[0]]
+        # One flag per text: a request's 'clusters' option only applies to its own texts
+        with_clusters = [bool(item[1].get('clusters')) for item in batch for _ in item[0]]
+        try:
+            results = self.score_fn(texts, with_clusters=with_clusters)
+        except Exception as exc:
+            for _, _, future, _ in batch:
+                future.set_exception(exc)
+            return
+        self.tracker.record_batch(len(texts))
+        offset = 0
+        for request_texts, _, future, submitted in batch:
+            future.set_result(results[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+            self.tracker.record(time.perf_counter() - submitted)
+
+def request_texts(request):
+    """
+    The texts of a request {'text': str} or {'texts': [str, ...]}; raises ValueError for anything else.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    if 'texts' in request:
+        texts = request['texts']
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ValueError("'texts' must be a list of strings")
+        return texts
+    text = request.get('text', '')
+    if not isinstance(text, str):
+        raise ValueError("'text' must be a string")
+    return [text]
+
+class ScoringService:
+    """
+    Keeps the sentence splitter, the compiled lexicon and (optionally) the embedding model and
+    topic centroids warm, and scores texts into per-sentence distortion flags.
+    """
+    def __init__(self, with_clusters=False, max_batch=None, max_wait_ms=None):
+        self.splitter = DataLoader()
+        self.detector = DistortionDetector()
+        self.modeler = None
+        self.centroids = {}
+        if with_clusters:
+            self._load_clusters()
+        self.tracker = LatencyTracker()
+        self.batcher = MicroBatcher(self.score_batch, max_batch, max_wait_ms, self.tracker)
+
+    def _load_clusters(self):
+        from .topic_modeler import TopicModeler
+        for _, name, _ in self.detector.lexicon:
+            path = os.path.join(Config.TABLES_DIR, f'topics_{name.replace(" ", "_")}_centroids.npy')
+            if os.path.exists(path):
+                self.centroids[name] = np.load(path)
+        if not self.centroids:
+            print("Warning: no topic centroids found, run --mode topic_model first. Serving without clusters.")
+            return
+        self.modeler = TopicModeler()
+
+    def score_batch(self, texts, with_clusters=False):
+        """
+        Scores a list of texts; with_clusters is one flag for all of them or a list with one flag per text.
+        Returns, per text, a list of {'sentence', 'mask', 'distortions'[, 'clusters': {distortion: cluster}]}
+        for its sentences.
+        """
+        if isinstance(with_clusters, bool):
+            with_clusters = [with_clusters] * len(texts)
+        results = []
+        flagged = []
+        for text, clusters in zip(texts, with_clusters):
+            sentences = []
+            for sentence in self.splitter.sent_tokenize(str(text)):
+                mask, _ = self.detector.score(sentence)
+                scored = {'sentence': sentence, 'mask': mask, 'distortions': self.detector.names_from_mask(mask)}
+                sentences.append(scored)
+                if mask and clusters and self.modeler is not None:
+                    flagged.append(scored)
+            results.append(sentences)
+
+        if flagged:
+            # One encode call for every flagged sentence in the micro-batch
+            embeddings = self.modeler.model.encode([s['sentence'] for s in flagged])
+            for scored, embedding in zip(flagged, embeddings):
+                scored['clusters'] = {}
+                for name in scored['distortions']:
+                    if name in self.centroids:
+                        distances = np.linalg.norm(self.centroids[name] - embedding, axis=1)
+                        scored['clusters'][name] = int(np.argmin(distances))
+        return results
+
+    def handle(self, request):
+        """
+        Handles one request {'text': str} or {'texts': [str, ...]}, optionally with 'clusters': true and an 'id'.
+        """
+        texts = request_texts(request)
+        results = self.batcher.submit(texts, {'clusters': request.get('clusters', False)}).result()
+        response = {'results': results}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def metrics(self):
+        return self.tracker.summary()
+
+def serve_http(service, host=None, port=None):
+    host = host or Config.SERVICE_HOST
+    port = port or Config.SERVICE_PORT
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send(200, service.metrics())
+            elif self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._send(404, {'error': 'not found'})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                self._send(200, service.handle(request))
+            except (ValueError, KeyError, TypeError) as exc:
+                self._send(400, {'error': str(exc)})
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024 # concurrent clients are the point of micro-batching
+
+    server = Server((host, port), Handler)
+    print(f"Serving on http://{host}:{port} (POST /score, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def serve_stdin(service, stdin=None, stdout=None):
+    """
+    JSONL worker: one request per input line, one response per output line, in input order.
+    Lines are submitted as they are read, so concurrent lines share micro-batches.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    pending = queue.Queue(maxsize=Config.SERVICE_MAX_BATCH * 4)
+
+    def write():
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            request, future = item
+            try:
+                response = {'results': future.result()}
+            except Exception as exc:
+                response = {'error': str(exc)}
+            if 'id' in request:
+                response['id'] = request['id']
+            stdout.write(json.dumps(response) + '\n')
+            stdout.flush()
+
+    writer = threading.Thread(target=write, name='jsonl-writer')
+    writer.start()
+    try:
+        for line in stdin:
+            if not line.strip():
+                continue
+            request = {}
+            try:
+                request = json.loads(line)
+                texts = request_texts(request)
+            except ValueError as exc:
+                failed = Future()
+                failed.set_exception(exc)
+                pending.put((request if isinstance(request, dict) else {}, failed))
+                continue
+            pending.put((request, service.batcher.submit(texts, {'clusters': request.get('clusters', False)})))
+    finally:
+        # The writer is not a daemon thread: without its sentinel the process never exits
+        pending.put(None)
+        writer.join()
+    print(json.dumps({'metrics': service.metrics()}), file=sys.stderr)
@@ -0,0 +1,286 @@
+"""
+Sharded map-reduce execution coordinated through a shared directory.
+
+The coordinator splits the input files into row-range shards and writes plan.json. Workers (local
+processes or `main.py --mode shard_worker` on other hosts that mount the same directory) claim
+shards by creating claims/<id> with O_EXCL, run preprocess_sentences and detect on them and write
+mergeable partials to parts/: the compact result rows, a RollupStore (daily counts and distinct-poster
+sketches) and comment CooccurrenceCounts. done/<id> is written last. The reduce step merges the
+partials into the same RollupStore / CooccurrenceCounts / result partitions a single-node run produces.
+
+    shard_dir/plan.json
+    shard_dir/claims/00003          host:pid of the worker processing shard 00003
+    shard_dir/parts/00003.rows.pkl  .rollups.pkl  .cooc.pkl
+    shard_dir/done/00003            JSON summary, written once all parts are in place
+"""
+import os
+import json
+import math
+import time
+import pickle
+import shutil
+import socket
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from .config import Config
+from .data_loader import DataLoader
+from .distortion_detector import DistortionDetector
+from .rollups import RollupStore
+from .cooccurrence import CooccurrenceCounts
+from .memory import PartitionStore, compact_frame
+from .fingerprint import fingerprint
+from .profiler import PROFILER
+
+PLAN_FILENAME = 'plan.json'
+
+# Config attributes a worker must share with the coordinator for its partials to be mergeable
+SHARED_CONFIG = ['PERIOD_BOUNDARIES', 'PERIOD_LABELS', 'DISTINCT_MODE', 'DISTINCT_ERROR']
+
+def count_csv_rows(path, nrows=None):
+    rows = sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=100000))
+    return min(rows, nrows) if nrows is not None else rows
+
+def plan_shards(posts_path, comments_path, n_shards, nrows=None):
+    """
+    Splits the posts and comments files into about n_shards row ranges of equal size (a shard never spans files).
+    offset is the position of the shard's first row in the frame DataLoader.load_data would return.
+    """
+    files = [(path, source_type) for path, source_type in [(posts_path, 'post'), (comments_path, 'comment')]
+             if path and os.path.exists(path)]
+    counts = [count_csv_rows(path, nrows) for path, _ in files]
+    rows_per_shard = max(1, math.ceil(sum(counts) / max(1, n_shards)))
+    shards, offset = [], 0
+    for (path, source_type), count in zip(files, counts):
+        for start in range(0, count, rows_per_shard):
+            shards.append({'id': f'{len(shards):05d}', 'path': os.path.abspath(path), 'source_type': source_type,
+                           'start': start, 'nrows': min(rows_per_shard, count - start), 'offset': offset + start})
+        offset += count
+    return shards
+
+def _write_atomic(path, write):
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+class ShardDirectory:
+    """
+    The shared directory: plan, claims, partial results and completion markers.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.plan_path = os.path.join(self.root, PLAN_FILENAME)
+        self.claims_dir = os.path.join(self.root, 'claims')
+        self.parts_dir = os.path.join(self.root, 'parts')
+        self.done_dir = os.path.join(self.root, 'done')
+
+    def prepare(self, plan):
+        """
+        Publishes plan. A directory already holding the same plan is kept, so finished shards are not redone.
+        """
+        existing = self.read_plan()
+        if existing is not None and existing['fingerprint'] == plan['fingerprint']:
+            return existing
+        for path in [self.claims_dir, self.parts_dir, self.done_dir]:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(plan, f, indent=2)
+        _write_atomic(self.plan_path, write)
+        return plan
+
+    def read_plan(self, wait=False):
+        while True:
+            try:
+                with open(self.plan_path) as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                if not wait:
+                    return None
+            time.sleep(Config.SHARD_POLL_S)
+
+    def part_path(self, shard_id, kind):
+        return os.path.join(self.parts_dir, f'{shard_id}.{kind}.pkl')
+
+    def is_done(self, shard_id):
+        return os.path.exists(os.path.join(self.done_dir, shard_id))
+
+    def done_info(self, shard_id):
+        with open(os.path.join(self.done_dir, shard_id)) as f:
+            return json.load(f)
+
+    def complete(self):
+        plan = self.read_plan()
+        return plan is not None and all(self.is_done(shard['id']) for shard in plan['shards'])
+
+    def claim(self, shard_id, steal_stale=True):
+        """
+        Atomically claims a shard. Claims older than Config.SHARD_CLAIM_TIMEOUT_S without a result are
+        considered abandoned (crashed worker) and can be taken over; at worst a shard is processed twice,
+        which is harmless as its parts are replaced atomically.
+        """
+        path = os.path.join(self.claims_dir, shard_id)
+        for _ in range(2):
+            if self.is_done(shard_id):
+                return False
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(path) > Config.SHARD_CLAIM_TIMEOUT_S
+                except FileNotFoundError:
+                    continue
+                if not (steal_stale and stale):
+                    return False
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{socket.gethostname()}:{os.getpid()}')
+            return True
+        return False
+
+    def release(self, shard_id):
+        try:
+            os.remove(os.path.join(self.claims_dir, shard_id))
+        except FileNotFoundError:
+            pass
+
+class ShardWorker:
+    """
+    Claims and processes shards of a ShardDirectory until none is left unclaimed.
+    """
+    def __init__(self, directory):
+        self.directory = directory if isinstance(directory, ShardDirectory) else ShardDirectory(directory)
+        self.loader = DataLoader()
+        self.detector = DistortionDetector()
+
+    def _apply_plan(self, plan):
+        for key, value in plan['config'].items():
+            setattr(Config, key, value)
+        if plan['lexicon'] != fingerprint(self.detector.distortion_dictionaries):
+            raise RuntimeError("This worker's distortion lexicon differs from the coordinator's")
+
+    def process(self, shard, distortion_names):
+        directory = self.directory
+        df = self.loader.load_shard(shard['path'], shard['source_type'], shard['start'], shard['nrows'], shard['offset'])
+        sentences = self.loader.preprocess_sentences(df)
+        del df
+        rollups = RollupStore(distortion_names)
+        cooc = CooccurrenceCounts(distortion_names)
+        rows = len(sentences)
+        if rows:
+            result, _ = self.detector.detect(sentences)
+            rollups.add_frame(result)
+            comments = result[result['source_type'] == 'comment']
+            if not comments.empty:
+                cooc.add_frame(comments)
+            partition = compact_frame(result, distortion_names)
+            def write_rows(path):
+                with open(path, 'wb') as f:
+                    pickle.dump(partition, f, protocol=pickle.HIGHEST_PROTOCOL)
+            _write_atomic(directory.part_path(shard['id'], 'rows'), write_rows)
+
+        def write_cooc(path):
+            with open(path, 'wb') as f:
+                pickle.dump(cooc, f, protocol=pickle.HIGHEST_PROTOCOL)
+        _write_atomic(directory.part_path(shard['id'], 'rollups'), rollups.save)
+        _write_atomic(directory.part_path(shard['id'], 'cooc'), write_cooc)
+        def write_done(path):
+            with open(path, 'w') as f:
+                json.dump({'rows': rows, 'worker': f'{socket.gethostname()}:{os.getpid()}'}, f)
+        _write_atomic(os.path.join(directory.done_dir, shard['id']), write_done)
+        return rows
+
+    def run(self, wait_for_plan=False):
+        """
+        Processes shards until every shard is done or claimed by a live worker. Returns the number processed.
+        """
+        plan = self.directory.read_plan(wait=wait_for_plan)
+        if plan is None:
+            return 0
+        self._apply_plan(plan)
+        processed = 0
+        for shard in plan['shards']:
+            if not self.directory.claim(shard['id']):
+                continue
+            start = time.perf_counter()
+            try:
+                with PROFILER.section(f"shard:{shard['id']}", rows_in=shard['nrows']) as record:
+                    record['rows_out'] = self.process(shard, plan['distortion_names'])
+            except BaseException:
+                # Let another worker retry the shard
+                self.directory.release(shard['id'])
+                raise
+            print(f"[shard] {shard['id']}: {record['rows_out']} sentences in {time.perf_counter() - start:.1f}s")
+            processed += 1
+        return processed
+
+def _run_worker(root):
+    return ShardWorker(root).run()
+
+def run_shards(directory, posts_path, comments_path, n_shards, workers=None, nrows=None):
+    """
+    Map step: plans the shards, processes them with `workers` local processes and waits until every shard
+    is done. While waiting, the coordinator itself takes unclaimed shards and those whose claims went stale,
+    so workers=0 runs on external workers plus the coordinator.
+    """
+    detector = DistortionDetector()
+    shards = plan_shards(posts_path, comments_path, n_shards, nrows)
+    if not shards:
+        raise SystemExit("No data found! Please check data/raw/ or provide paths.")
+    plan = {
+        'shards': shards,
+        'config': {key: getattr(Config, key) for key in SHARED_CONFIG},
+        'lexicon': fingerprint(detector.distortion_dictionaries),
+        'distortion_names': list(detector.distortion_dictionaries),
+    }
+    plan['fingerprint'] = fingerprint(plan, [(shard['path'], os.path.getsize(shard['path']),
+                                              os.path.getmtime(shard['path'])) for shard in shards])
+    plan = directory.prepare(plan)
+    pending = [shard['id'] for shard in plan['shards'] if not directory.is_done(shard['id'])]
+    print(f"[shard] {len(plan['shards'])} shard(s) in {directory.root}, {len(pending)} to process")
+
+    workers = os.cpu_count() if workers is None else workers
+    if pending and workers:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            for future in [pool.submit(_run_worker, directory.root) for _ in range(min(workers, len(pending)))]:
+                future.result()
+
+    worker = None
+    while not directory.complete():
+        # Shards left to external workers: help out, and take over those abandoned by crashed workers
+        worker = worker or ShardWorker(directory)
+        worker.run()
+        time.sleep(Config.SHARD_POLL_S)
+    return directory
+
+def reduce_partitions(directory):
+    """
+    The result rows of every shard, in shard (= input) order, as a PartitionStore.
+    """
+    plan = directory.read_plan()
+    paths, rows = [], 0
+    for shard in plan['shards']:
+        shard_rows = directory.done_info(shard['id'])['rows']
+        if shard_rows:
+            paths.append(directory.part_path(shard['id'], 'rows'))
+            rows += shard_rows
+    return PartitionStore.from_files('shards', paths, rows, plan['distortion_names']), plan['distortion_names']
+
+def reduce_rollups(directory):
+    plan = directory.read_plan()
+    store = RollupStore(plan['distortion_names'])
+    for shard in plan['shards']:
+        store.merge(RollupStore.load(directory.part_path(shard['id'], 'rollups')))
+    return store
+
+def reduce_cooccurrence(directory):
+    plan = directory.read_plan()
+    cooc = CooccurrenceCounts(plan['distortion_names'])
+    for shard in plan['shards']:
+        with open(directory.part_path(shard['id'], 'cooc'), 'rb') as f:
+            cooc.merge(pickle.load(f))
+    return cooc
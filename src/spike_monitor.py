@@ -0,0 +1,143 @@
+"""
+Online version of Visualizer.filter_and_identify_spikes: a week is a spike when its normalized count
+(per 100 posters) exceeds the mean of the previous `window` weeks by more than their standard deviation.
+
+The state is one ring buffer of the last `window` weekly values per (distortion, source_type), with running
+sums and sums of squares, so every new week costs O(1) per series whatever the length of the history.
+It is persisted between runs; each update consumes the complete weeks of new rollups and appends the
+spikes found to a JSONL event log. The latest week of an update may still be incomplete: it is held back
+(as daily partials, including the distinct-poster sketches) and completed by the next update.
+"""
+import os
+import json
+import pickle
+import numpy as np
+import pandas as pd
+from .config import Config
+from .rollups import RollupStore
+
+DAY = pd.Timedelta(days=1)
+WEEK = pd.Timedelta(days=7)
+
+def append_events(events, path=None):
+    path = path or Config.SPIKE_EVENTS_PATH
+    with open(path, 'a') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+    return path
+
+class SpikeMonitor:
+    def __init__(self, distortion_names, source_types=None, window=None):
+        self.distortion_names = list(distortion_names)
+        self.source_types = list(source_types or Config.SPIKE_SOURCE_TYPES)
+        self.window = window or Config.SPIKE_WINDOW
+        self.keys = [(distortion, source) for source in self.source_types for distortion in self.distortion_names]
+        self.buffer = np.zeros((len(self.keys), self.window))
+        self.sum = np.zeros(len(self.keys))
+        self.sumsq = np.zeros(len(self.keys))
+        self.filled = np.zeros(len(self.keys), dtype=np.int64) # weeks seen per series since its first data, up to window
+        self.pos = 0 # ring position of the oldest week (all series advance together)
+        self.last_week = None # label (Sunday, as resample('W')) of the last consumed week
+        self.pending = None # RollupStore with the days of the held-back week
+        self.pending_week = None
+
+    def _push(self, week, values, counts, posters):
+        """
+        Consumes one week: checks every series with `window` previous weeks against them, then rolls the buffers.
+        A series starts at the first week of its source type with posters, like the batch series.
+        """
+        events = []
+        mean = self.sum / self.window
+        std = np.sqrt(np.maximum(self.sumsq / self.window - mean ** 2, 0))
+        # The tolerance absorbs the rounding of the running sums (the batch rule compares exact window statistics)
+        spikes = (self.filled == self.window) & (values - mean > std + 1e-9)
+        for k in np.flatnonzero(spikes):
+            distortion, source = self.keys[k]
+            events.append({'week': week.date().isoformat(), 'distortion': distortion, 'source_type': source,
+                           'value': round(float(values[k]), 6), 'mean': round(float(mean[k]), 6),
+                           'std': round(float(std[k]), 6), 'count': int(counts[k]), 'posters': int(posters[k])})
+        old = self.buffer[:, self.pos]
+        self.sum -= old
+        self.sumsq -= old ** 2
+        started = (self.filled > 0) | (posters > 0)
+        self.filled = np.where(started, np.minimum(self.filled + 1, self.window), 0)
+        self.buffer[:, self.pos] = values
+        self.sum += values
+        self.sumsq += values ** 2
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            # Once per cycle, recompute the sums exactly so that floating point drift does not accumulate
+            self.sum, self.sumsq = self.buffer.sum(axis=1), (self.buffer ** 2).sum(axis=1)
+        self.last_week = week
+        return events
+
+    def _weekly(self, store):
+        """
+        (weeks, values, counts, posters): per week, arrays over self.keys.
+        """
+        counts_by_source, posters_by_source = {}, {}
+        for source in self.source_types:
+            counts, posters = store.view('W', source_type=None if source == 'all' else source)
+            counts_by_source[source], posters_by_source[source] = counts, posters
+        weeks = counts_by_source[self.source_types[0]].index
+        for source in self.source_types[1:]:
+            weeks = weeks.union(counts_by_source[source].index)
+        weeks = pd.date_range(weeks.min(), weeks.max(), freq='W')
+        counts = np.hstack([counts_by_source[s].reindex(weeks, fill_value=0)[self.distortion_names].to_numpy()
+                            for s in self.source_types])
+        posters = np.hstack([np.repeat(posters_by_source[s].reindex(weeks, fill_value=0).to_numpy()[:, None],
+                                       len(self.distortion_names), axis=1) for s in self.source_types])
+        values = counts / np.maximum(posters, 1) * 100 # as prepare_time_series: posters of 0 count as 1
+        return weeks, values, counts, posters
+
+    def update(self, store):
+        """
+        Consumes the complete weeks of a RollupStore and returns the spike events found in them.
+        Updates are treated as new data, except when they reach back before the held-back week (e.g. a rerun
+        over the whole history): the held-back week is then taken from the update only. Days of already
+        consumed weeks are ignored.
+        """
+        if store.distortion_names != self.distortion_names:
+            raise ValueError("Rollups and spike monitor state have different distortions")
+        days = store.days()
+        if not len(days):
+            return []
+        if self.pending is not None and days.min() >= self.pending_week - 6 * DAY:
+            store = self.pending.merge(store)
+        if self.last_week is not None:
+            store = store.subset(start=self.last_week + DAY)
+            if not len(store.days()):
+                return []
+
+        weeks, values, counts, posters = self._weekly(store)
+        events = []
+        for i, week in enumerate(weeks[:-1]):
+            # Weeks without any data between two updates are zeros, like the gaps resample() fills in batch
+            while self.last_week is not None and self.last_week + WEEK < week:
+                zeros = np.zeros(len(self.keys))
+                events.extend(self._push(self.last_week + WEEK, zeros, zeros, zeros))
+            events.extend(self._push(week, values[i], counts[i], posters[i]))
+        self.pending_week = weeks[-1]
+        self.pending = store.subset(start=self.pending_week - 6 * DAY)
+        return events
+
+    def save(self, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.SPIKE_MONITOR_FILENAME)
+        state = {key: getattr(self, key) for key in ['distortion_names', 'source_types', 'window', 'buffer', 'sum',
+                                                     'sumsq', 'filled', 'pos', 'last_week', 'pending_week']}
+        state['pending'] = self.pending.to_state() if self.pending is not None else None
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.path.join(Config.PROCESSED_DATA_DIR, Config.SPIKE_MONITOR_FILENAME)
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        monitor = cls(state['distortion_names'], state['source_types'], state['window'])
+        for key in ['buffer', 'sum', 'sumsq', 'filled', 'pos', 'last_week', 'pending_week']:
+            setattr(monitor, key, state[key])
+        monitor.pending = RollupStore.from_state(state['pending']) if state['pending'] is not None else None
+        return monitor
@@ -1,26 +1,80 @@
-from sentence_transformers import SentenceTransformer
 from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.metrics import davies_bouldin_score
 import pandas as pd
 import numpy as np
 from .config import Config
+from .profiler import instrumented
+
+class HashingEncoder:
+    """
+    Offline stand-in for a SentenceTransformer (Config.HASHING_MODEL_NAME): L2-normalized hashed
+    word uni/bigram counts. Only meant for tests and benchmarks, not for real topic modeling.
+    """
+    def __init__(self, n_features=256):
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm='l2')
+
+    def encode(self, sentences, show_progress_bar=False, **kwargs):
+        return self.vectorizer.transform(sentences).toarray().astype(np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.vectorizer.n_features
+
+def load_encoder(model_name):
+    """
+    The SentenceTransformer called model_name, or the hashing stand-in.
+    """
+    if model_name == Config.HASHING_MODEL_NAME:
+        print("Using offline hashing encoder (no SentenceTransformer)...")
+        return HashingEncoder()
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading SentenceTransformer model: {model_name}...")
+    return SentenceTransformer(model_name)
 
 class TopicModeler:
-    def __init__(self, model_name=Config.MODEL_NAME):
-        print(f"Loading SentenceTransformer model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name=None, load_model=True):
+        self.model_name = model_name or Config.MODEL_NAME
+        # Clustering only (e.g. in topic scheduler workers), embeddings are computed elsewhere.
+        # With encoder processes, the pool loads the model; here it is only loaded if a small input needs it
+        self._model = load_encoder(self.model_name) if load_model and Config.ENCODER_PROCESSES <= 1 else None
+        self.pool = None # EncodingPool, started on first use and kept until close()
+        # Cluster centers of the last run per distortion, used to assign new sentences to topics
+        self.centroids = {}
 
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_encoder(self.model_name)
+        return self._model
+
+    def close(self):
+        """
+        Stops the encoder processes, if any were started.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    @instrumented('generate_embeddings')
     def generate_embeddings(self, sentences):
         """
         Returns embeddings for a list of sentences.
         """
         print(f"Generating embeddings for {len(sentences)} sentences...")
+        if Config.ENCODER_PROCESSES > 1 and len(sentences) > Config.ENCODER_CHUNK_SIZE:
+            if self.pool is None:
+                from .encoding_pool import EncodingPool
+                self.pool = EncodingPool(self.model_name)
+            return self.pool.encode(sentences)
         # Encode in batches to avoid OOM, though sentence-transformers handles it well usually
         return self.model.encode(sentences, show_progress_bar=True)
 
-    def find_optimal_clusters(self, embeddings, k_min=10, k_max=100, k_step=10):
+    @instrumented('find_optimal_clusters')
+    def find_optimal_clusters(self, embeddings, k_min=10, k_max=100, k_step=10, sample_weight=None):
         """
         Tests multiple K values and returns the best model based on Davies-Bouldin score.
+        With sample_weight, each KMeans fit is weighted but davies_bouldin_score (which takes no weights)
+        scores every row once, so K is chosen on the distinct rows (e.g. one per near-duplicate group).
         """
         best_score = float('inf')
         best_k = k_min
@@ -32,7 +86,7 @@ class TopicModeler:
                 break
                 
             kmeans = KMeans(n_clusters=k, random_state=42, n_init=5) # n_init=5 for speed
-            labels = kmeans.fit_predict(embeddings)
+            labels = kmeans.fit_predict(embeddings, sample_weight=sample_weight)
             score = davies_bouldin_score(embeddings, labels)
             
             print(f"K={k}, DB Score={score:.4f}")
@@ -47,25 +101,26 @@ class TopicModeler:
 
     def run_clustering(self, sentences_df, distortion_name):
         """
-        Full pipeline for a specific distortion subset.
+        Full pipeline for a specific distortion subset: TopicScheduler's, in this process.
+        Returns the flagged rows with a 'cluster' (and 'dup_group') column, or None when there are too few.
         """
-        subset = sentences_df[sentences_df[distortion_name] == True].copy()
-        
-        if len(subset) < 20:
-             print(f"Not enough data for clustering {distortion_name} (n={len(subset)})")
-             return None
+        from .topic_scheduler import TopicScheduler
+        return TopicScheduler(self, workers=1).run(sentences_df, [distortion_name]).get(distortion_name)
 
-        embeddings = self.generate_embeddings(subset['sentence'].tolist())
-        
+    def cluster_embeddings(self, embeddings, sample_weight=None):
+        """
+        Searches K and fits the final KMeans. Returns (labels, cluster centers).
+        sample_weight: e.g. near-duplicate group sizes when embeddings holds one row per group.
+        """
         # Find best K
         best_k, _ = self.find_optimal_clusters(embeddings, 
                                                k_min=Config.CLUSTERS_K_MIN, 
                                                k_max=Config.CLUSTERS_K_MAX, 
-                                               k_step=Config.CLUSTERS_K_STEP)
+                                               k_step=Config.CLUSTERS_K_STEP,
+                                               sample_weight=sample_weight)
         
-        # Final Cluster
+        # Final Cluster (near-duplicate collapsing can leave fewer points than K_MIN)
+        best_k = min(best_k, len(embeddings))
         kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(embeddings)
-        
-        subset['cluster'] = labels
-        return subset
+        labels = kmeans.fit_predict(embeddings, sample_weight=sample_weight)
+        return labels, kmeans.cluster_centers_
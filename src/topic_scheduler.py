@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+from .config import Config
+from .distortion_detector import ENTRIES_COLUMN
+from .memory import iter_frames
+from .near_duplicates import NearDuplicates
+from .profiler import PROFILER
+from .topic_modeler import TopicModeler
+
+MIN_CLUSTER_ROWS = 20
+
+_WORKER = {}
+
+def _init_worker(threads, k_range):
+    # KMeans threads per process, so that the pool does not oversubscribe the cores
+    _WORKER['limits'] = threadpool_limits(limits=threads)
+    Config.CLUSTERS_K_MIN, Config.CLUSTERS_K_MAX, Config.CLUSTERS_K_STEP = k_range
+    _WORKER['modeler'] = TopicModeler(load_model=False)
+
+def _attach(name, shape, dtype):
+    # Pool workers share the coordinator's resource tracker, which unlinks the block once (in run)
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _cluster_job(name, shape, dtype, distortion, indices, weights):
+    start = time.perf_counter()
+    shm, embeddings = _attach(name, shape, dtype)
+    try:
+        subset = embeddings[indices] # rows of this distortion, copied out of the shared block
+    finally:
+        del embeddings
+        shm.close()
+    labels, centers = _WORKER['modeler'].cluster_embeddings(subset, sample_weight=weights)
+    return distortion, labels, centers, time.perf_counter() - start
+
+class TopicScheduler:
+    """
+    Topic modeling for every distortion: the flagged sentences are embedded once with the loaded model,
+    then per-distortion K search and clustering jobs run in a process pool, largest first. The embedding
+    matrix is passed to the workers through shared memory; each job only receives its row indices.
+    With Config.NEAR_DUP_THRESHOLD, near-duplicate sentences are collapsed first: only one sentence per
+    group is embedded and each distortion clusters its groups weighted by their number of sentences.
+    """
+    def __init__(self, modeler=None, workers=None):
+        self.modeler = modeler or TopicModeler()
+        self.workers = workers or Config.TOPIC_WORKERS or os.cpu_count() or 1
+
+    def _flagged(self, result, distortion_names):
+        """
+        The sentences flagged with at least one distortion (result is a DataFrame or a PartitionStore).
+        """
+        frames = [frame[frame[distortion_names].any(axis=1)].drop(columns=[ENTRIES_COLUMN], errors='ignore')
+                  for frame in iter_frames(result)]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def run(self, result, distortion_names):
+        """
+        Returns {distortion: flagged rows with a 'cluster' (and 'dup_group') column} and fills modeler.centroids.
+        Distortions with fewer than MIN_CLUSTER_ROWS sentences are skipped.
+        """
+        flagged = self._flagged(result, distortion_names)
+        sentences = flagged['sentence'].astype(str).tolist() if len(flagged) else []
+        dedup = bool(Config.NEAR_DUP_THRESHOLD) and len(flagged) > 0
+        if dedup:
+            representatives, _, group = NearDuplicates().collapse(sentences)
+            flagged['dup_group'] = group
+        else:
+            representatives, group = np.arange(len(flagged)), np.arange(len(flagged))
+
+        jobs = []
+        for distortion in distortion_names:
+            indices = np.flatnonzero(flagged[distortion].to_numpy(dtype=bool)) if len(flagged) else np.array([], dtype=np.int64)
+            if len(indices) < MIN_CLUSTER_ROWS:
+                print(f"Not enough data for clustering {distortion} (n={len(indices)})")
+                continue
+            # Rows of the embedding matrix (one per group), weighted by the group's sentences with this distortion
+            rows, members, weights = np.unique(group[indices], return_inverse=True, return_counts=True)
+            jobs.append((distortion, indices, rows, weights if dedup else None, members))
+        if not jobs:
+            return {}
+        # Largest first, so the longest K searches don't end up last on an otherwise idle pool
+        jobs.sort(key=lambda job: len(job[2]), reverse=True)
+
+        # Embed once: every flagged sentence (or group representative), whatever the number of distortions it carries
+        embeddings = np.ascontiguousarray(self.modeler.generate_embeddings([sentences[i] for i in representatives]))
+        jobs_by_distortion = {job[0]: job for job in jobs}
+        fitted = {}
+        workers = min(self.workers, len(jobs))
+        print(f"Clustering {len(jobs)} distortions with {workers} process(es)...")
+        if workers == 1:
+            for distortion, indices, rows, weights, _ in jobs:
+                start = time.perf_counter()
+                fitted[distortion] = self.modeler.cluster_embeddings(embeddings[rows], sample_weight=weights)
+                self._record(distortion, len(indices), time.perf_counter() - start)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, embeddings.nbytes))
+            try:
+                np.ndarray(embeddings.shape, dtype=embeddings.dtype, buffer=shm.buf)[:] = embeddings
+                threads = max(1, (os.cpu_count() or 1) // workers)
+                k_range = (Config.CLUSTERS_K_MIN, Config.CLUSTERS_K_MAX, Config.CLUSTERS_K_STEP)
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads, k_range)) as pool:
+                    futures = [pool.submit(_cluster_job, shm.name, embeddings.shape, embeddings.dtype.str, distortion, rows, weights)
+                               for distortion, _, rows, weights, _ in jobs]
+                    for future in as_completed(futures):
+                        distortion, labels, centers, seconds = future.result()
+                        fitted[distortion] = (labels, centers)
+                        self._record(distortion, len(jobs_by_distortion[distortion][1]), seconds)
+            finally:
+                shm.close()
+                shm.unlink()
+
+        clustered = {}
+        for distortion in distortion_names:
+            if distortion in fitted:
+                labels, self.modeler.centroids[distortion] = fitted[distortion]
+                _, indices, _, _, members = jobs_by_distortion[distortion]
+                subset = flagged.iloc[indices].copy()
+                subset['cluster'] = labels[members] # a group's sentences share its cluster
+                clustered[distortion] = subset
+        return clustered
+
+    def _record(self, distortion, rows, seconds):
+        print(f"Clustered {distortion} (n={rows}) in {seconds:.1f}s")
+        PROFILER.record(f'cluster:{distortion}', rows_in=rows, wall_s=round(seconds, 4))
@@ -1,14 +1,20 @@
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
 import numpy as np
 import os
-import math
 from .config import Config
+from .plot_renderer import PlotRenderer
+from .cooccurrence import CooccurrenceCounts, period_ranges
+from .rollups import RollupStore
+from .memory import iter_frames
+from .rolling_correlation import rolling_correlation, top_pairs, pair_series
 
 class Visualizer:
-    def __init__(self):
-        plt.style.use('seaborn-v0_8-whitegrid')
+    def __init__(self, plot_workers=None, force_plots=False):
+        plt.style.use(Config.PLOT_STYLE)
+        self.renderer = PlotRenderer(workers=plot_workers, force=force_plots)
 
     def filter_and_identify_spikes(self, data, window_size=4):
         """
@@ -30,23 +36,20 @@ class Visualizer:
                 filtered_data.append(0)
         return pd.Series(filtered_data, index=data.index)
 
-    def prepare_time_series(self, df, distortion_names):
+    def prepare_time_series(self, df, distortion_names, resolution='W', rollups=None):
         """
-        Aggregates data into weekly Raw, Normalized, and Spike series.
+        Aggregates data into Raw, Normalized, and Spike series (weekly by default).
+        Built from a RollupStore of daily partials, which can be passed in instead of df.
         """
-        df = df.dropna(subset=[Config.DATE_COLUMN])
-        df = df.set_index(Config.DATE_COLUMN).sort_index()
+        if rollups is None:
+            rollups = RollupStore.from_frame(df, distortion_names)
+        counts, posters = rollups.view(resolution)
+        posters = posters.replace(0, 1)
         
         weekly_data = {}
-        if Config.AUTHOR_COLUMN in df.columns:
-            weekly_posters = df[Config.AUTHOR_COLUMN].resample('W').nunique()
-        else:
-            weekly_posters = df.resample('W').size()
-        weekly_posters = weekly_posters.replace(0, 1)
-
         for distortion in distortion_names:
-            raw_counts = df[distortion].resample('W').sum()
-            norm_counts = (raw_counts / weekly_posters) * 100
+            raw_counts = counts[distortion]
+            norm_counts = (raw_counts / posters) * 100
             spikes = self.filter_and_identify_spikes(norm_counts)
             
             weekly_data[distortion] = {
@@ -58,86 +61,55 @@ class Visualizer:
 
     def _plot_grid(self, weekly_data, data_type, title_suffix, output_dir, color):
         """
-        Helper to plot 12 distortions in a single figure (3x4 grid) AND individual plots.
+        Builds the jobs for 12 distortions in a single figure (3x4 grid) AND individual plots.
         """
-        distortion_names = list(weekly_data.keys())
-        n = len(distortion_names)
-        cols = 4
-        rows = math.ceil(n / cols)
-        
-        # 1. Summary Plot (All in One Image)
-        fig, axes = plt.subplots(rows, cols, figsize=(20, 15))
-        axes = axes.flatten()
-        
-        for i, distortion in enumerate(distortion_names):
-            series = weekly_data[distortion][data_type]
-            ax = axes[i]
-            if data_type == 'spikes':
-                ax.bar(series.index, series, color=color, width=5)
-            else:
-                ax.plot(series.index, series, color=color)
-            ax.set_title(distortion)
-            ax.tick_params(axis='x', rotation=45)
-            
-            # 2. Individual Plot (One per file)
-            plt.figure(figsize=(10, 6))
-            if data_type == 'spikes':
-                plt.bar(series.index, series, color=color, width=5)
-            else:
-                plt.plot(series.index, series, color=color)
-            plt.title(f'{distortion} - {title_suffix}')
-            plt.xlabel('Date')
-            plt.ylabel('Value')
-            plt.tight_layout()
-            indiv_path = os.path.join(output_dir, f'{distortion.replace(" ", "_")}.png')
-            plt.savefig(indiv_path)
-            plt.close()
-
-        # Hide empty subplots in summary
-        for i in range(n, len(axes)):
-            axes[i].axis('off')
-            
-        fig.suptitle(f'All Distortions - {title_suffix}', fontsize=16)
-        plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-        summary_path = os.path.join(output_dir, 'SUMMARY_ALL_PLOTS.png')
-        fig.savefig(summary_path)
-        plt.close(fig)
-        print(f"Saved summary and individual plots to {output_dir}")
+        jobs = [{
+            'kind': 'summary',
+            'path': os.path.join(output_dir, 'SUMMARY_ALL_PLOTS.png'),
+            'series': {d: s_dict[data_type] for d, s_dict in weekly_data.items()},
+            'data_type': data_type,
+            'color': color,
+            'title': f'All Distortions - {title_suffix}',
+        }]
+        for distortion, s_dict in weekly_data.items():
+            jobs.append({
+                'kind': 'series',
+                'path': os.path.join(output_dir, f'{distortion.replace(" ", "_")}.png'),
+                'series': s_dict[data_type],
+                'data_type': data_type,
+                'color': color,
+                'title': f'{distortion} - {title_suffix}',
+            })
+        return jobs
+
+    def _time_series_jobs(self, weekly_data):
+        return (self._plot_grid(weekly_data, 'raw', 'Raw Counts', Config.PLOT_TS_RAW_DIR, 'blue')
+                + self._plot_grid(weekly_data, 'norm', 'Normalized', Config.PLOT_TS_NORM_DIR, 'green')
+                + self._plot_grid(weekly_data, 'spikes', 'Spikes', Config.PLOT_TS_SPIKES_DIR, 'red'))
 
     def plot_time_series(self, weekly_data):
         print("Generating Segregated Time Series Plots...")
-        self._plot_grid(weekly_data, 'raw', 'Raw Counts', Config.PLOT_TS_RAW_DIR, 'blue')
-        self._plot_grid(weekly_data, 'norm', 'Normalized', Config.PLOT_TS_NORM_DIR, 'green')
-        self._plot_grid(weekly_data, 'spikes', 'Spikes', Config.PLOT_TS_SPIKES_DIR, 'red')
+        self.renderer.render(self._time_series_jobs(weekly_data))
+
+    def _combined_trends_jobs(self, weekly_data):
+        return [{
+            'kind': 'combined',
+            'path': os.path.join(Config.PLOTS_DIR, 'combined_trends_covid.png'),
+            'series': {d: s_dict['norm'].rolling(window=4).mean() for d, s_dict in weekly_data.items()},
+            'markers': [('COVID Start', pd.to_datetime(Config.COVID_START_DATE)),
+                        ('COVID End', pd.to_datetime(Config.COVID_END_DATE))],
+            'title': 'Combined Normalized Trends',
+        }]
 
     def plot_combined_trends(self, weekly_data):
         print("Generating Combined Suman Plot...")
-        plt.figure(figsize=(16, 8))
-        for distortion, series_dict in weekly_data.items():
-            smoothed = series_dict['norm'].rolling(window=4).mean()
-            plt.plot(smoothed.index, smoothed, label=distortion, alpha=0.7)
-            
-        covid_start = pd.to_datetime(Config.COVID_START_DATE)
-        covid_end = pd.to_datetime(Config.COVID_END_DATE)
-        plt.axvline(x=covid_start, color='red', linestyle='--', label='COVID Start')
-        plt.axvline(x=covid_end, color='red', linestyle='--', label='COVID End')
-        
-        plt.title('Combined Normalized Trends')
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        path = os.path.join(Config.PLOTS_DIR, 'combined_trends_covid.png')
-        plt.savefig(path)
-        plt.close()
+        self.renderer.render(self._combined_trends_jobs(weekly_data))
 
-    def plot_correlation_matrices(self, weekly_data):
-        print("Generating Time-Series Correlation Matrices...")
-        periods = {
-            'Before': (None, Config.COVID_START_DATE),
-            'During': (Config.COVID_START_DATE, Config.COVID_END_DATE),
-            'After': (Config.COVID_END_DATE, None)
-        }
+    def _correlation_matrix_jobs(self, weekly_data):
+        periods = period_ranges()
         data_types = ['raw', 'norm', 'spikes']
         
+        jobs = []
         for p_name, (start, end) in periods.items():
             for d_type in data_types:
                 df = pd.DataFrame()
@@ -149,54 +121,117 @@ class Visualizer:
                 
                 if df.empty: continue
                 
-                plt.figure(figsize=(10, 8))
-                sns.heatmap(df.corr(), annot=True, cmap='coolwarm', fmt=".2f")
-                plt.title(f'Correlation: {p_name} ({d_type})')
-                plt.tight_layout()
-                path = os.path.join(Config.PLOT_CORR_DIR, f'corr_ts_{p_name}_{d_type}.png')
-                plt.savefig(path)
-                plt.close()
+                jobs.append({
+                    'kind': 'heatmap',
+                    'path': os.path.join(Config.PLOT_CORR_DIR, f'corr_ts_{p_name}_{d_type}.png'),
+                    'matrix': df.corr(),
+                    'title': f'Correlation: {p_name} ({d_type})',
+                })
+        return jobs
 
-    def plot_per_comment_correlations(self, df, distortion_names):
+    def plot_correlation_matrices(self, weekly_data):
+        print("Generating Time-Series Correlation Matrices...")
+        self.renderer.render(self._correlation_matrix_jobs(weekly_data))
+
+    def comment_cooccurrence(self, df, distortion_names):
         """
-        Calculates correlation based on co-occurrence in COMMENTS only.
-        Splits by time period.
+        Co-occurrence counts of the comments in df (a DataFrame or a PartitionStore, counted partition by partition).
         """
-        print("Generating Per-Comment Correlation Matrices...")
-        
-        # Filter for comments only
-        comments_df = df[df['source_type'] == 'comment'].copy()
+        cooc = CooccurrenceCounts(distortion_names)
+        for frame in iter_frames(df):
+            # Filter for comments only
+            comments_df = frame[frame['source_type'] == 'comment']
+            if not comments_df.empty:
+                cooc.add_frame(comments_df)
+        return cooc
+
+    def _per_comment_correlation_jobs(self, df, distortion_names, cooc=None):
+        """
+        Calculates co-occurrence correlation in COMMENTS only, per time period.
+        Also exports counts, phi, lift and PMI tables. Precomputed (e.g. merged) counts can be passed as cooc.
+        """
+        if cooc is None:
+            cooc = self.comment_cooccurrence(df, distortion_names)
         
-        if comments_df.empty:
+        if not cooc.n.sum():
             print("No comments found for per-comment correlation.")
-            return
+            return []
 
-        periods = {
-            'Before': (None, Config.COVID_START_DATE),
-            'During': (Config.COVID_START_DATE, Config.COVID_END_DATE),
-            'After': (Config.COVID_END_DATE, None)
-        }
-        
-        for p_name, (start, end) in periods.items():
-            subset = comments_df.copy()
-            if start:
-                subset = subset[subset[Config.DATE_COLUMN] >= pd.to_datetime(start)]
-            if end:
-                subset = subset[subset[Config.DATE_COLUMN] < pd.to_datetime(end)]
-            
-            if subset.empty:
+        return self._cooccurrence_jobs(cooc)
+
+    def _cooccurrence_jobs(self, cooc):
+        cooc.export_tables('cooc_comment')
+        jobs = []
+        for p_name, n in zip(cooc.labels, cooc.n):
+            if not n:
                 continue
-                
-            # Convert boolean columns to int for correlation
-            corr_df = subset[distortion_names].astype(int)
-            corr = corr_df.corr()
-            
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(corr, annot=True, cmap='coolwarm', fmt=".2f", vmin=-1, vmax=1)
-            plt.title(f'Correlation (Per Comment): {p_name} COVID')
-            plt.tight_layout()
-            
-            path = os.path.join(Config.PLOT_CORR_DIR, f'corr_comment_{p_name}.png')
-            plt.savefig(path)
-            plt.close()
-            print(f"Saved corr_comment_{p_name}.png (n={len(subset)})")
+            metrics = cooc.metrics(p_name)
+            jobs.append({
+                'kind': 'heatmap',
+                'path': os.path.join(Config.PLOT_CORR_DIR, f'corr_comment_{p_name}.png'),
+                'matrix': metrics['phi'],
+                'title': f'Correlation (Per Comment): {p_name}',
+                'heatmap_kws': {'vmin': -1, 'vmax': 1},
+            })
+            jobs.append({
+                'kind': 'heatmap',
+                'path': os.path.join(Config.PLOT_CORR_DIR, f'pmi_comment_{p_name}.png'),
+                'matrix': metrics['pmi'],
+                'title': f'PMI (Per Comment): {p_name}',
+                'heatmap_kws': {'center': 0},
+            })
+            print(f"Queued corr_comment_{p_name}.png (n={n})")
+        return jobs
+
+    def plot_per_comment_correlations(self, df, distortion_names):
+        print("Generating Per-Comment Correlation Matrices...")
+        self.renderer.render(self._per_comment_correlation_jobs(df, distortion_names))
+
+    def _rolling_correlation_jobs(self, weekly_data, data_type='norm', window=None, pairs=None, resolution='W'):
+        """
+        Rolling-window correlation of the series. The window counts periods of resolution (the pandas alias the
+        series were aggregated with). Saves the full (windows x d x d) array and plots the selected pairs
+        (default: the pairs with the strongest mean correlation).
+        """
+        window = window or Config.ROLLING_CORR_WINDOW
+        unit = {alias: name for name, alias in Config.RESOLUTIONS.items()}.get(resolution, resolution)
+        pairs = pairs or Config.ROLLING_CORR_PAIRS
+        frame = pd.DataFrame({d: s_dict[data_type] for d, s_dict in weekly_data.items()})
+        names = list(frame.columns)
+        corr, end_index = rolling_correlation(frame, window)
+        if not len(corr):
+            print(f"Not enough {unit}s for a {window}-{unit} rolling correlation (n={len(frame)})")
+            return []
+
+        array_path = os.path.join(Config.TABLES_DIR, f'rolling_corr_{data_type}_w{window}.npz')
+        np.savez_compressed(array_path, corr=corr, dates=end_index.values.astype('datetime64[ns]'), names=np.array(names))
+        print(f"Saved rolling correlation array {corr.shape} to {array_path}")
+
+        pairs = pairs or top_pairs(corr, names)
+        return [{
+            'kind': 'combined',
+            'path': os.path.join(Config.PLOT_CORR_DIR, f'rolling_corr_{data_type}_w{window}.png'),
+            'series': pair_series(corr, end_index, names, pairs),
+            'markers': [(f'{label} start', pd.to_datetime(start)) for label, (start, _) in period_ranges().items() if start],
+            'title': f'{window}-{unit.capitalize()} Rolling Correlation ({data_type})',
+        }]
+
+    def plot_rolling_correlations(self, weekly_data, data_type='norm', window=None, pairs=None, resolution='W'):
+        print("Generating Rolling Correlation Plot...")
+        self.renderer.render(self._rolling_correlation_jobs(weekly_data, data_type, window, pairs, resolution))
+
+    def plot_all(self, weekly_data, df, distortion_names, cooc=None, resolution='W'):
+        """
+        Builds every plot of the 'all' mode up front and renders them in one process pool.
+        df is only read for the per-comment co-occurrence when cooc is not given; resolution is the
+        pandas alias weekly_data was aggregated with (prepare_time_series).
+        """
+        print("Building plot jobs...")
+        jobs = (self._time_series_jobs(weekly_data)
+                + self._combined_trends_jobs(weekly_data)
+                + self._correlation_matrix_jobs(weekly_data)
+                + self._rolling_correlation_jobs(weekly_data, resolution=resolution)
+                + self._per_comment_correlation_jobs(df, distortion_names, cooc))
+        self.renderer.render(jobs)
+        print(f"Saved {len(jobs)} plots to {Config.PLOTS_DIR}")
+        return [job['path'] for job in jobs]